@@ -18,13 +18,26 @@ Atlas module
 Core module which provides access to MongoDB Atlas Cloud Provider APIs
 """
 
+import asyncio
+import copy
+import threading
+from collections import OrderedDict, deque
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
+from urllib.parse import quote
 
+from dateutil import parser as dateparser
 from dateutil.relativedelta import relativedelta
 
 from .errors import *
+from .changes import canonical_hash
+from .concurrency import RateLimiter, parallel_map, parallel_map_async, workers
+from .deadline import Deadline, bind, use, within
 from .network import Network
 from .settings import Settings
+from .specs import DatabaseUsersUpdatePermissionsSpecs
+from .waiter import ClusterStateWatcher
 
 
 class Atlas:
@@ -34,14 +47,79 @@ class Atlas:
         user (str): Atlas user
         password (str): Atlas password
         group (str): Atlas group
+
+    Keyword Args:
+        circuit_breaker (CircuitBreakers): Fail fast on unhealthy endpoints (None to disable)
+        timeout (float or tuple): Request timeout or (connect, read) timeouts for this instance
+        journal (Journal): Record mutations to resume interrupted batches (None to disable)
+        prewarm (bool): Prepare connections and authentication in background (see prewarm())
+        pool_maxsize (int): Connections kept in the pool, use the number of threads sharing the instance
+                            (default to Settings.pool_maxsize)
+        keys (list): (user, password) of additional API keys with access to the group,
+                     requests are distributed over all keys (see KeyPool)
+        hedging (HedgingPolicy): Duplicate slow GET requests (None to disable)
+        cache (ResponseCache): Persistent cache of GET responses shared by processes (None to disable)
+        transport (Transport): Send the requests with this transport instead of HTTP
+                               (eg: atlasapi.testing.FakeAtlas)
+
+    An Atlas instance (and the ones from with_group()) can be shared between threads.
     """
 
-    def __init__(self, user, password, group):
+    def __init__(self, user, password, group, circuit_breaker=None, timeout=None, journal=None, prewarm=False,
+                 pool_maxsize=None, keys=None, hedging=None, cache=None, transport=None):
         self.group = group
+        self.journal = journal
 
         # Network calls which will handld user/passord for auth
-        self.network = Network(user, password)
+        self.network = Network(user, password, circuit_breaker, timeout, pool_maxsize, keys, hedging,
+                               cache, transport)
+
+        self._init_apis()
+
+        if prewarm:
+            self.prewarm(background=True)
+
+    @classmethod
+    def for_project(cls, user, password, name, index=None, **kwargs):
+        """Get an Atlas instance from a project name
+
+        Args:
+            user (str): Atlas user
+            password (str): Atlas password
+            name (str): Project name
+
+        Keyword Args:
+            index (ProjectIndex): Resolve the name with an index (one Get One Project by Name request otherwise)
+            **kwargs: Atlas constructor keyword arguments
+
+        Returns:
+            Atlas: Atlas instance
+
+        Raises:
+            ErrAtlasNotFound: No project with this name
+        """
+        atlas = cls(user, password, None, **kwargs)
+        if index is not None:
+            atlas.group = index.id_of(name)
+        else:
+            atlas.group = atlas.Projects.get_one_project_by_name(name)["id"]
+        return atlas
+
+    def prewarm(self, connections=Settings.prewarm_connections, background=False):
+        """Prepare the network before the first real request
+
+        Resolve and cache the Atlas address, open pooled connections and get a digest nonce.
+
+        Keyword Args:
+            connections (int): Number of connections to open
+            background (bool): Return immediately and prewarm in a background thread
+
+        Returns:
+            Thread or None: The background thread
+        """
+        return self.network.prewarm(connections, background)
 
+    def _init_apis(self):
         # APIs
         self.Clusters = Atlas._Clusters(self)
         self.Whitelist = Atlas._Whitelist(self)
@@ -49,6 +127,45 @@ class Atlas:
         self.Projects = Atlas._Projects(self)
         self.Alerts = Atlas._Alerts(self)
 
+    def journaled(self, operation, target, fn, payload=None):
+        """Run a mutation through the journal (if any)
+
+        Args:
+            operation (str): Operation name
+            target (str): Target of the operation
+            fn (function): The mutation
+
+        Keyword Args:
+            payload (dict or list): Payload of the mutation, its digest is part of the operation identity
+
+        Returns:
+            The mutation result
+        """
+        if self.journal is None:
+            return fn()
+
+        key = "%s|%s|%s" % (operation, self.group, target)
+        if payload is not None:
+            key += "|" + canonical_hash(payload).hex()
+
+        return self.journal.run(key, fn)
+
+    def with_group(self, group):
+        """Get an Atlas instance on another group
+
+        The network (credentials, hooks, circuit breakers, ...) is shared.
+
+        Args:
+            group (str): Atlas group
+
+        Returns:
+            Atlas: Atlas instance
+        """
+        atlas = copy.copy(self)
+        atlas.group = group
+        atlas._init_apis()
+        return atlas
+
     class _Clusters:
         """Clusters API
 
@@ -62,6 +179,8 @@ class Atlas:
 
         def __init__(self, atlas):
             self.atlas = atlas
+            self._watcher = None
+            self._watcher_lock = threading.Lock()
 
         def is_existing_cluster(self, cluster):
             """Check if the cluster exists
@@ -81,7 +200,24 @@ class Atlas:
             except ErrAtlasNotFound:
                 return False
 
-        def get_all_clusters(self, pageNum=Settings.pageNum, itemsPerPage=Settings.itemsPerPage, iterable=False):
+        def exist_many(self, names, concurrency=Settings.concurrency):
+            """Check if clusters exist
+
+            Not part of Atlas api but provided to simplify some code.
+            Walk the clusters once or get them one by one, whichever needs fewer requests.
+
+            Args:
+                names (iterable of str): The cluster names
+
+            Keyword Args:
+                concurrency (int or AdaptiveLimiter): Maximum number of concurrent requests
+
+            Returns:
+                dict: name -> bool (the cluster exists or not)
+            """
+            return _exist_many(names, self.get_all_clusters, self.get_a_single_cluster, "name", concurrency)
+
+        def get_all_clusters(self, pageNum=Settings.pageNum, itemsPerPage=Settings.itemsPerPage, iterable=False, deadline=None, cache=True):
             """Get All Clusters
 
             url: https://docs.atlas.mongodb.com/reference/api/clusters-get-all/
@@ -90,6 +226,8 @@ class Atlas:
                 pageNum (int): Page number
                 itemsPerPage (int): Number of Users per Page
                 iterable (bool): To return an iterable high level object instead of a low level API response
+                deadline (float): Seconds to complete the call (the whole walk when iterable)
+                cache (bool): Read the response cache (False for a fresh response, which is still cached)
 
             Returns:
                 AtlasPagination or dict: Iterable object representing this function OR Response payload
@@ -102,13 +240,14 @@ class Atlas:
             ErrPaginationLimits.checkAndRaise(pageNum, itemsPerPage)
 
             if iterable:
-                return ClustersGetAll(self.atlas, pageNum, itemsPerPage)
+                return ClustersGetAll(self.atlas, pageNum, itemsPerPage, deadline, cache)
 
             uri = Settings.api_resources["Clusters"]["Get All Clusters"] % (
                 self.atlas.group, pageNum, itemsPerPage)
-            return self.atlas.network.get(Settings.BASE_URL + uri)
+            with within(deadline):
+                return self.atlas.network.get(Settings.BASE_URL + uri, endpoint=("Clusters", "Get All Clusters"), cache=cache)
 
-        def get_a_single_cluster(self, cluster):
+        def get_a_single_cluster(self, cluster, cache=True):
             """Get a Single Cluster
 
             url: https://docs.atlas.mongodb.com/reference/api/clusters-get-one/
@@ -116,12 +255,15 @@ class Atlas:
             Args:
                 cluster (str): The cluster name
 
+            Keyword Args:
+                cache (bool): Read the response cache (False for a fresh response, which is still cached)
+
             Returns:
                 dict: Response payload
             """
             uri = Settings.api_resources["Clusters"]["Get a Single Cluster"] % (
                 self.atlas.group, cluster)
-            return self.atlas.network.get(Settings.BASE_URL + uri)
+            return self.atlas.network.get(Settings.BASE_URL + uri, endpoint=("Clusters", "Get a Single Cluster"), cache=cache)
 
         def delete_a_cluster(self, cluster, areYouSure=False):
             """Delete a Cluster
@@ -143,11 +285,73 @@ class Atlas:
             if areYouSure:
                 uri = Settings.api_resources["Clusters"]["Delete a Cluster"] % (
                     self.atlas.group, cluster)
-                return self.atlas.network.delete(Settings.BASE_URL + uri)
+                return self.atlas.journaled("Delete a Cluster", cluster,
+                                            lambda: self.atlas.network.delete(Settings.BASE_URL + uri, endpoint=("Clusters", "Delete a Cluster")))
             else:
                 raise ErrConfirmationRequested(
                     "Please set areYouSure=True on delete_a_cluster call if you really want to delete [%s]" % cluster)
 
+        def wait_for_state(self, names, target_states, timeout=None):
+            """Wait until clusters reach a state
+
+            Not part of Atlas api but provided to simplify some code
+
+            All waiters of this Atlas instance share one polling loop with an adaptive interval.
+            A deleted cluster is reported with the ClusterStatesSpec.DELETED state.
+
+            Args:
+                names (str or list of str): Cluster name(s)
+                target_states (ClusterStatesSpec or list of ClusterStatesSpec): Accepted state(s)
+
+            Keyword Args:
+                timeout (float): Maximum seconds to wait (None to wait forever)
+
+            Returns:
+                dict: Cluster name -> state
+
+            Raises:
+                ErrWaitTimeout: The timeout is reached
+                ErrAtlasGeneric: Polling failed with a non transient error (network issues, 429 and 5xx are retried)
+            """
+            return self._watch(names, target_states, timeout).result()
+
+        async def wait_for_state_async(self, names, target_states, timeout=None):
+            """Wait until clusters reach a state (asyncio)
+
+            see: wait_for_state
+
+            Args:
+                names (str or list of str): Cluster name(s)
+                target_states (ClusterStatesSpec or list of ClusterStatesSpec): Accepted state(s)
+
+            Keyword Args:
+                timeout (float): Maximum seconds to wait (None to wait forever)
+
+            Returns:
+                dict: Cluster name -> state
+
+            Raises:
+                ErrWaitTimeout: The timeout is reached
+            """
+            return await asyncio.wrap_future(self._watch(names, target_states, timeout))
+
+        def _watch(self, names, target_states, timeout):
+            """Register a waiter on the shared watcher
+
+            Returns:
+                Future: Resolved with a dict cluster name -> state
+            """
+            if isinstance(names, str):
+                names = [names]
+            if isinstance(target_states, str):
+                target_states = [target_states]
+
+            with self._watcher_lock:
+                if self._watcher is None:
+                    self._watcher = ClusterStateWatcher(self.atlas)
+
+            return self._watcher.watch(names, target_states, timeout)
+
     class _Whitelist:
         """Whitelist API
 
@@ -162,7 +366,7 @@ class Atlas:
         def __init__(self, atlas):
             self.atlas = atlas
 
-        def get_all_whitelist_entries(self, pageNum=Settings.pageNum, itemsPerPage=Settings.itemsPerPage, iterable=False):
+        def get_all_whitelist_entries(self, pageNum=Settings.pageNum, itemsPerPage=Settings.itemsPerPage, iterable=False, deadline=None, cache=True):
             """Get All whitelist entries
 
             url: https://docs.atlas.mongodb.com/reference/api/whitelist-get-all/
@@ -171,6 +375,8 @@ class Atlas:
                 pageNum (int): Page number
                 itemsPerPage (int): Number of Users per Page
                 iterable (bool): To return an iterable high level object instead of a low level API response
+                deadline (float): Seconds to complete the call (the whole walk when iterable)
+                cache (bool): Read the response cache (False for a fresh response, which is still cached)
 
             Returns:
                 AtlasPagination or dict: Iterable object representing this function OR Response payload
@@ -183,13 +389,14 @@ class Atlas:
             ErrPaginationLimits.checkAndRaise(pageNum, itemsPerPage)
 
             if iterable:
-                return WhitelistGetAll(self.atlas, pageNum, itemsPerPage)
+                return WhitelistGetAll(self.atlas, pageNum, itemsPerPage, deadline, cache)
 
             uri = Settings.api_resources["Whitelist"]["Get All Whitelist Entries"] % (
                 self.atlas.group, pageNum, itemsPerPage)
-            return self.atlas.network.get(Settings.BASE_URL + uri)
+            with within(deadline):
+                return self.atlas.network.get(Settings.BASE_URL + uri, endpoint=("Whitelist", "Get All Whitelist Entries"), cache=cache)
 
-        def get_whitelist_entry(self, ip_address):
+        def get_whitelist_entry(self, ip_address, cache=True):
             """Get a whitelist entry
 
             url: https://docs.atlas.mongodb.com/reference/api/whitelist-get-one-entry/
@@ -197,12 +404,15 @@ class Atlas:
             Args:
                 ip_address (str): ip address to fetch from whitelist
 
+            Keyword Args:
+                cache (bool): Read the response cache (False for a fresh response, which is still cached)
+
             Returns:
                 dict: Response payload
             """
             uri = Settings.api_resources["Whitelist"]["Get Whitelist Entry"] % (
                 self.atlas.group, ip_address)
-            return self.atlas.network.get(Settings.BASE_URL + uri)
+            return self.atlas.network.get(Settings.BASE_URL + uri, endpoint=("Whitelist", "Get Whitelist Entry"), cache=cache)
 
         def create_whitelist_entry(self, ip_address, comment):
             """Create a whitelist entry
@@ -219,7 +429,9 @@ class Atlas:
             uri = Settings.api_resources["Whitelist"]["Create Whitelist Entry"] % self.atlas.group
 
             whitelist_entry = [{'ipAddress': ip_address, 'comment': comment}]
-            return self.atlas.network.post(Settings.BASE_URL + uri, whitelist_entry)
+            return self.atlas.journaled("Create Whitelist Entry", ip_address,
+                                        lambda: self.atlas.network.post(Settings.BASE_URL + uri, whitelist_entry, endpoint=("Whitelist", "Create Whitelist Entry")),
+                                        whitelist_entry)
 
         def delete_a_whitelist_entry(self, ip_address):
             """Delete a whitelist entry
@@ -234,7 +446,8 @@ class Atlas:
             """
             uri = Settings.api_resources["Whitelist"]["Delete Whitelist Entry"] % (
                 self.atlas.group, ip_address)
-            return self.atlas.network.delete(Settings.BASE_URL + uri)
+            return self.atlas.journaled("Delete Whitelist Entry", ip_address,
+                                        lambda: self.atlas.network.delete(Settings.BASE_URL + uri, endpoint=("Whitelist", "Delete Whitelist Entry")))
 
     class _DatabaseUsers:
         """Database Users API
@@ -250,7 +463,7 @@ class Atlas:
         def __init__(self, atlas):
             self.atlas = atlas
 
-        def get_all_database_users(self, pageNum=Settings.pageNum, itemsPerPage=Settings.itemsPerPage, iterable=False):
+        def get_all_database_users(self, pageNum=Settings.pageNum, itemsPerPage=Settings.itemsPerPage, iterable=False, deadline=None, cache=True):
             """Get All Database Users
 
             url: https://docs.atlas.mongodb.com/reference/api/database-users-get-all-users/
@@ -259,6 +472,8 @@ class Atlas:
                 pageNum (int): Page number
                 itemsPerPage (int): Number of Users per Page
                 iterable (bool): To return an iterable high level object instead of a low level API response
+                deadline (float): Seconds to complete the call (the whole walk when iterable)
+                cache (bool): Read the response cache (False for a fresh response, which is still cached)
 
             Returns:
                 AtlasPagination or dict: Iterable object representing this function OR Response payload
@@ -271,13 +486,32 @@ class Atlas:
             ErrPaginationLimits.checkAndRaise(pageNum, itemsPerPage)
 
             if iterable:
-                return DatabaseUsersGetAll(self.atlas, pageNum, itemsPerPage)
+                return DatabaseUsersGetAll(self.atlas, pageNum, itemsPerPage, deadline, cache)
 
             uri = Settings.api_resources["Database Users"]["Get All Database Users"] % (
                 self.atlas.group, pageNum, itemsPerPage)
-            return self.atlas.network.get(Settings.BASE_URL + uri)
+            with within(deadline):
+                return self.atlas.network.get(Settings.BASE_URL + uri, endpoint=("Database Users", "Get All Database Users"), cache=cache)
+
+        def exist_many(self, usernames, concurrency=Settings.concurrency):
+            """Check if database users exist
+
+            Not part of Atlas api but provided to simplify some code.
+            Walk the users once or get them one by one, whichever needs fewer requests.
+
+            Args:
+                usernames (iterable of str): The usernames
+
+            Keyword Args:
+                concurrency (int or AdaptiveLimiter): Maximum number of concurrent requests
+
+            Returns:
+                dict: username -> bool (the user exists or not)
+            """
+            return _exist_many(usernames, self.get_all_database_users, self.get_a_single_database_user,
+                               "username", concurrency)
 
-        def get_a_single_database_user(self, user):
+        def get_a_single_database_user(self, user, cache=True):
             """Get a Database User
 
             url: https://docs.atlas.mongodb.com/reference/api/database-users-get-single-user/
@@ -285,12 +519,15 @@ class Atlas:
             Args:
                 user (str): User
 
+            Keyword Args:
+                cache (bool): Read the response cache (False for a fresh response, which is still cached)
+
             Returns:
                 dict: Response payload
             """
             uri = Settings.api_resources["Database Users"]["Get a Single Database User"] % (
                 self.atlas.group, user)
-            return self.atlas.network.get(Settings.BASE_URL + uri)
+            return self.atlas.network.get(Settings.BASE_URL + uri, endpoint=("Database Users", "Get a Single Database User"), cache=cache)
 
         def create_a_database_user(self, permissions):
             """Create a Database User
@@ -304,7 +541,10 @@ class Atlas:
                 dict: Response payload
             """
             uri = Settings.api_resources["Database Users"]["Create a Database User"] % self.atlas.group
-            return self.atlas.network.post(Settings.BASE_URL + uri, permissions.getSpecs())
+            payload = permissions.getSpecs()
+            return self.atlas.journaled("Create a Database User", permissions.username,
+                                        lambda: self.atlas.network.post(Settings.BASE_URL + uri, payload, endpoint=("Database Users", "Create a Database User")),
+                                        payload)
 
         def update_a_database_user(self, user, permissions):
             """Update a Database User
@@ -320,7 +560,10 @@ class Atlas:
             """
             uri = Settings.api_resources["Database Users"]["Update a Database User"] % (
                 self.atlas.group, user)
-            return self.atlas.network.patch(Settings.BASE_URL + uri, permissions.getSpecs())
+            payload = permissions.getSpecs()
+            return self.atlas.journaled("Update a Database User", user,
+                                        lambda: self.atlas.network.patch(Settings.BASE_URL + uri, payload, endpoint=("Database Users", "Update a Database User")),
+                                        payload)
 
         def delete_a_database_user(self, user):
             """Delete a Database User
@@ -335,7 +578,75 @@ class Atlas:
             """
             uri = Settings.api_resources["Database Users"]["Delete a Database User"] % (
                 self.atlas.group, user)
-            return self.atlas.network.delete(Settings.BASE_URL + uri)
+            return self.atlas.journaled("Delete a Database User", user,
+                                        lambda: self.atlas.network.delete(Settings.BASE_URL + uri, endpoint=("Database Users", "Delete a Database User")))
+
+        def sync_database_users(self, permissions, delete_missing=False, rotate_passwords=False,
+                                concurrency=Settings.concurrency, rate=None):
+            """Synchronize Database Users with a list of permissions
+
+            Not part of Atlas api but provided to provision a lot of users at once
+
+            Current users are streamed from DatabaseUsersGetAll and compared with the expected ones
+            (roles are compared as sets). Only the needed create/update/delete calls are sent, concurrently.
+
+            Args:
+                permissions (list of DatabaseUsersPermissionsSpecs): Expected users
+
+            Keyword Args:
+                delete_missing (bool): Delete existing users which are not part of permissions
+                rotate_passwords (bool): Update the password of existing users (Atlas never returns passwords)
+                concurrency (int): Maximum number of concurrent requests
+                rate (float): Maximum number of requests per second (None for no limit)
+
+            Returns:
+                dict: Report per username. Each entry is a dict with an "action" ("create", "update", "delete" or None),
+                      a "status" ("done", "failed" or "unchanged") and "details" (Response payload or Exception)
+            """
+            expected = {p.username: p for p in permissions}
+            limiter = RateLimiter(rate) if rate else None
+
+            @bind
+            def call(fn, *args):
+                if limiter:
+                    limiter.acquire()
+                return fn(*args)
+
+            report = {}
+
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = {}
+
+                for user in DatabaseUsersGetAll(self.atlas, Settings.pageNum, Settings.itemsPerPage, cache=False):
+                    username = user["username"]
+                    p = expected.pop(username, None)
+
+                    if p is None:
+                        if delete_missing:
+                            futures[executor.submit(call, self.delete_a_database_user, username)] = (username, "delete")
+                        continue
+
+                    if not rotate_passwords and _role_keys(user["roles"]) == p.role_keys():
+                        report[username] = {"action": None, "status": "unchanged", "details": None}
+                        continue
+
+                    update = DatabaseUsersUpdatePermissionsSpecs(p.password if rotate_passwords else None)
+                    update.roles = p.roles
+
+                    futures[executor.submit(call, self.update_a_database_user, username, update)] = (username, "update")
+
+                # Remaining users don't exist yet
+                for username, p in expected.items():
+                    futures[executor.submit(call, self.create_a_database_user, p)] = (username, "create")
+
+                for future in as_completed(futures):
+                    username, action = futures[future]
+                    try:
+                        report[username] = {"action": action, "status": "done", "details": future.result()}
+                    except Exception as e:
+                        report[username] = {"action": action, "status": "failed", "details": e}
+
+            return report
 
     class _Projects:
         """Projects API
@@ -351,7 +662,7 @@ class Atlas:
         def __init__(self, atlas):
             self.atlas = atlas
 
-        def get_all_projects(self, pageNum=Settings.pageNum, itemsPerPage=Settings.itemsPerPage, iterable=False):
+        def get_all_projects(self, pageNum=Settings.pageNum, itemsPerPage=Settings.itemsPerPage, iterable=False, deadline=None, cache=True):
             """Get All Projects
 
             url: https://docs.atlas.mongodb.com/reference/api/project-get-all/
@@ -360,6 +671,8 @@ class Atlas:
                 pageNum (int): Page number
                 itemsPerPage (int): Number of Users per Page
                 iterable (bool): To return an iterable high level object instead of a low level API response
+                deadline (float): Seconds to complete the call (the whole walk when iterable)
+                cache (bool): Read the response cache (False for a fresh response, which is still cached)
 
             Returns:
                 AtlasPagination or dict: Iterable object representing this function OR Response payload
@@ -372,13 +685,14 @@ class Atlas:
             ErrPaginationLimits.checkAndRaise(pageNum, itemsPerPage)
 
             if iterable:
-                return ProjectsGetAll(self.atlas, pageNum, itemsPerPage)
+                return ProjectsGetAll(self.atlas, pageNum, itemsPerPage, deadline, cache)
 
             uri = Settings.api_resources["Projects"]["Get All Projects"] % (
                 pageNum, itemsPerPage)
-            return self.atlas.network.get(Settings.BASE_URL + uri)
+            with within(deadline):
+                return self.atlas.network.get(Settings.BASE_URL + uri, endpoint=("Projects", "Get All Projects"), cache=cache)
 
-        def get_one_project(self, groupid):
+        def get_one_project(self, groupid, cache=True):
             """Get one Project
 
             url: https://docs.atlas.mongodb.com/reference/api/project-get-one/
@@ -386,12 +700,32 @@ class Atlas:
             Args:
                 groupid (str): Group Id
 
+            Keyword Args:
+                cache (bool): Read the response cache (False for a fresh response, which is still cached)
+
             Returns:
                 dict: Response payload
             """
             uri = Settings.api_resources["Projects"]["Get One Project"] % (
                 groupid)
-            return self.atlas.network.get(Settings.BASE_URL + uri)
+            return self.atlas.network.get(Settings.BASE_URL + uri, endpoint=("Projects", "Get One Project"), cache=cache)
+
+        def get_one_project_by_name(self, name, cache=True):
+            """Get one Project by name
+
+            url: https://docs.atlas.mongodb.com/reference/api/project-get-one-by-name/
+
+            Args:
+                name (str): Project name
+
+            Keyword Args:
+                cache (bool): Read the response cache (False for a fresh response, which is still cached)
+
+            Returns:
+                dict: Response payload
+            """
+            uri = Settings.api_resources["Projects"]["Get One Project by Name"] % quote(name, safe="")
+            return self.atlas.network.get(Settings.BASE_URL + uri, endpoint=("Projects", "Get One Project by Name"), cache=cache)
 
         def create_a_project(self, name, orgId=None):
             """Create a Project
@@ -413,7 +747,9 @@ class Atlas:
             if orgId:
                 project["orgId"] = orgId
 
-            return self.atlas.network.post(Settings.BASE_URL + uri, project)
+            return self.atlas.journaled("Create a Project", name,
+                                        lambda: self.atlas.network.post(Settings.BASE_URL + uri, project, endpoint=("Projects", "Create a Project")),
+                                        project)
 
     class _Alerts:
         """Alerts API
@@ -429,7 +765,7 @@ class Atlas:
         def __init__(self, atlas):
             self.atlas = atlas
 
-        def get_all_alerts(self, status=None, pageNum=Settings.pageNum, itemsPerPage=Settings.itemsPerPage, iterable=False):
+        def get_all_alerts(self, status=None, pageNum=Settings.pageNum, itemsPerPage=Settings.itemsPerPage, iterable=False, deadline=None, cache=True):
             """Get All Alerts
 
             url: https://docs.atlas.mongodb.com/reference/api/alerts-get-all-alerts/
@@ -439,6 +775,8 @@ class Atlas:
                 pageNum (int): Page number
                 itemsPerPage (int): Number of Users per Page
                 iterable (bool): To return an iterable high level object instead of a low level API response
+                deadline (float): Seconds to complete the call (the whole walk when iterable)
+                cache (bool): Read the response cache (False for a fresh response, which is still cached)
 
             Returns:
                 AtlasPagination or dict: Iterable object representing this function OR Response payload
@@ -451,18 +789,21 @@ class Atlas:
             ErrPaginationLimits.checkAndRaise(pageNum, itemsPerPage)
 
             if iterable:
-                return AlertsGetAll(self.atlas, status, pageNum, itemsPerPage)
+                return AlertsGetAll(self.atlas, status, pageNum, itemsPerPage, deadline, cache)
 
             if status:
+                endpoint = ("Alerts", "Get All Alerts with status")
                 uri = Settings.api_resources["Alerts"]["Get All Alerts with status"] % (
                     self.atlas.group, status, pageNum, itemsPerPage)
             else:
+                endpoint = ("Alerts", "Get All Alerts")
                 uri = Settings.api_resources["Alerts"]["Get All Alerts"] % (
                     self.atlas.group, pageNum, itemsPerPage)
 
-            return self.atlas.network.get(Settings.BASE_URL + uri)
+            with within(deadline):
+                return self.atlas.network.get(Settings.BASE_URL + uri, endpoint=endpoint, cache=cache)
 
-        def get_an_alert(self, alert):
+        def get_an_alert(self, alert, cache=True):
             """Get an Alert 
 
             url: https://docs.atlas.mongodb.com/reference/api/alerts-get-alert/
@@ -470,12 +811,15 @@ class Atlas:
             Args:
                 alert (str): The alert id
 
+            Keyword Args:
+                cache (bool): Read the response cache (False for a fresh response, which is still cached)
+
             Returns:
                 dict: Response payload
             """
             uri = Settings.api_resources["Alerts"]["Get an Alert"] % (
                 self.atlas.group, alert)
-            return self.atlas.network.get(Settings.BASE_URL + uri)
+            return self.atlas.network.get(Settings.BASE_URL + uri, endpoint=("Alerts", "Get an Alert"), cache=cache)
 
         def acknowledge_an_alert(self, alert, until, comment=None):
             """Acknowledge an Alert
@@ -493,13 +837,128 @@ class Atlas:
                 dict: Response payload
             """
 
+            return self._acknowledge(alert, self._acknowledge_data(until, comment))
+
+        def acknowledge_alerts(self, alerts, until, comment=None, concurrency=Settings.concurrency):
+            """Acknowledge multiple Alerts
+
+            Not part of Atlas api but provided to acknowledge a lot of alerts at once (eg: during an incident)
+
+            Alerts are streamed from AlertsGetAll and the ones already acknowledged until `until` (or later)
+            are skipped. Acknowledgements are sent concurrently.
+
+            Args:
+                alerts (list of str or AlertStatusSpec): Alert ids OR a status filter
+                until (datetime): Acknowledge until
+
+            Keyword Args:
+                comment (str): The acknowledge comment
+                concurrency (int): Maximum number of concurrent requests
+
+            Returns:
+                dict: Report per alert id. Each entry is a dict with a "status" ("acknowledged", "skipped" or "failed")
+                      and "details" (Response payload, current acknowledgedUntil or Exception)
+            """
+            data = self._acknowledge_data(until, comment)
+
+            if until.tzinfo is None:
+                until = until.replace(tzinfo=timezone.utc)
+
+            report = {}
+            seen = set()
+
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = {}
+
+                for alert in self._select_alerts(alerts):
+                    alert_id = alert["id"]
+                    if alert_id in seen:
+                        continue
+                    seen.add(alert_id)
+
+                    acknowledgedUntil = alert.get("acknowledgedUntil")
+                    if acknowledgedUntil:
+                        acknowledgedUntil = dateparser.parse(acknowledgedUntil)
+                        if acknowledgedUntil.tzinfo is None:
+                            acknowledgedUntil = acknowledgedUntil.replace(tzinfo=timezone.utc)
+
+                        if acknowledgedUntil >= until:
+                            report[alert_id] = {"status": "skipped", "details": alert["acknowledgedUntil"]}
+                            continue
+
+                    futures[executor.submit(bind(self._acknowledge), alert_id, data)] = alert_id
+
+                for future in as_completed(futures):
+                    alert_id = futures[future]
+                    try:
+                        report[alert_id] = {"status": "acknowledged", "details": future.result()}
+                    except Exception as e:
+                        report[alert_id] = {"status": "failed", "details": e}
+
+            return report
+
+        def _select_alerts(self, alerts):
+            """Stream alerts matching ids or a status filter
+
+            Args:
+                alerts (list of str or AlertStatusSpec): Alert ids OR a status filter
+
+            Yields:
+                dict: One alert
+            """
+            if isinstance(alerts, str):
+                yield from AlertsGetAll(self.atlas, alerts, Settings.pageNum, Settings.itemsPerPage, cache=False)
+                return
+
+            remaining = set(alerts)
+            if not remaining:
+                return
+
+            for alert in AlertsGetAll(self.atlas, None, Settings.pageNum, Settings.itemsPerPage, cache=False):
+                if alert["id"] in remaining:
+                    remaining.discard(alert["id"])
+                    yield alert
+
+                    if not remaining:
+                        return
+
+            # Unknown alerts: let Atlas answer for them
+            for alert_id in remaining:
+                yield {"id": alert_id}
+
+        def _acknowledge_data(self, until, comment=None):
+            """Build the acknowledge payload
+
+            Args:
+                until (datetime): Acknowledge until
+
+            Keyword Args:
+                comment (str): The acknowledge comment
+
+            Returns:
+                dict: Payload
+            """
             data = {"acknowledgedUntil": until.isoformat(timespec='seconds')}
             if comment:
                 data["acknowledgementComment"] = comment
 
+            return data
+
+        def _acknowledge(self, alert, data):
+            """Send an acknowledge payload
+
+            Args:
+                alert (str): The alert id
+                data (dict): Payload built by _acknowledge_data
+
+            Returns:
+                dict: Response payload
+            """
             uri = Settings.api_resources["Alerts"]["Acknowledge an Alert"] % (
                 self.atlas.group, alert)
-            return self.atlas.network.patch(Settings.BASE_URL + uri, data)
+            return self.atlas.journaled("Acknowledge an Alert", alert,
+                                        lambda: self.atlas.network.patch(Settings.BASE_URL + uri, data, endpoint=("Alerts", "Acknowledge an Alert")),
+                                        data)
 
         def unacknowledge_an_alert(self, alert):
             """Acknowledge an Alert
@@ -541,6 +1000,64 @@ class Atlas:
             return self.acknowledge_an_alert(alert, until, comment)
 
 
+def _role_keys(roles):
+    """Roles as a set
+
+    Args:
+        roles (list of dict): Roles as returned by Atlas
+
+    Returns:
+        frozenset: (databaseName, roleName, collectionName) tuples
+    """
+    return frozenset((r["databaseName"], r["roleName"], r.get("collectionName")) for r in roles)
+
+
+def _exist_many(names, get_all, get_one, field, concurrency):
+    """Check if resources exist with the cheapest strategy
+
+    With more names than listing pages (totalCount probed with itemsPerPage=1), the
+    listing is walked once. Otherwise the resources are fetched one by one concurrently.
+    The response cache is bypassed.
+
+    Args:
+        names (iterable of str): Names
+        get_all (function): get_all_* function of the resource
+        get_one (function): Get one resource by name
+        field (str): Name field of the resource
+        concurrency (int or AdaptiveLimiter): Fixed concurrency or adaptive limiter
+
+    Returns:
+        dict: name -> bool, in the order of names
+    """
+    names = list(OrderedDict.fromkeys(names))
+
+    if len(names) > 1:
+        total = get_all(pageNum=1, itemsPerPage=1, cache=False)["totalCount"]
+        pages = -(-total // Settings.itemsPerPageMax)
+
+        if pages < len(names):
+            existing = set()
+            if total:
+                listing = get_all(itemsPerPage=Settings.itemsPerPageMax, iterable=True, cache=False)
+                for results in listing.pages(concurrency):
+                    existing.update(item[field] for item in results)
+            return {name: name in existing for name in names}
+
+    def exists(name):
+        try:
+            get_one(name, cache=False)
+            return True
+        except ErrAtlasNotFound:
+            return False
+
+    result = OrderedDict()
+    for outcome in parallel_map(names, exists, concurrency, ordered=True):
+        if outcome.error is not None:
+            raise outcome.error
+        result[outcome.item] = outcome.value
+    return dict(result)
+
+
 class AtlasPagination:
     """Atlas Pagination Generic Implementation
 
@@ -551,13 +1068,19 @@ class AtlasPagination:
         fetch (function): The function "get_all" to call
         pageNum (int): Page number
         itemsPerPage (int): Number of Users per Page
+
+    Keyword Args:
+        deadline (float): Seconds to complete the whole walk
+        cache (bool): Read the response cache (False for fresh pages)
     """
 
-    def __init__(self, atlas, fetch, pageNum, itemsPerPage):
+    def __init__(self, atlas, fetch, pageNum, itemsPerPage, deadline=None, cache=True):
         self.atlas = atlas
         self.fetch = fetch
         self.pageNum = pageNum
         self.itemsPerPage = itemsPerPage
+        self.deadline = deadline
+        self.cache = cache
 
     def __iter__(self):
         """Iterable
@@ -565,79 +1088,321 @@ class AtlasPagination:
         Yields:
             str: One result
         """
+        for results in self.pages():
+            yield from results
+
+    def pages(self, concurrency=None, limiter=None):
+        """Iterate page by page
+
+        With an AdaptiveLimiter, every page is fetched in a slot of the limiter and
+        throttled fetches (429) are retried (see AdaptiveLimiter.run).
+
+        Keyword Args:
+            concurrency (int or AdaptiveLimiter): Fetch the next pages concurrently once the first
+                                                  one gives the total (None to fetch one by one)
+            limiter (AdaptiveLimiter): Limiter of a one by one walk (eg: shared by many walks)
+
+        Yields:
+            list: Results of one page, in order
+        """
 
         # pageNum is set with the value requested (so not necessary 1)
         pageNum = self.pageNum
         # total: This is a fake value to enter into the while. It will be updated with a real value later
         total = pageNum * self.itemsPerPage
+        # budget shared by all pages
+        budget = Deadline(self.deadline) if self.deadline is not None else None
+
+        if concurrency is not None:
+            details = self._fetch(pageNum, budget, workers(concurrency)[1])
+            yield details["results"]
+            yield from self._parallel_pages(pageNum + 1, details["totalCount"], budget, concurrency)
+            return
 
         while (pageNum * self.itemsPerPage - total < self.itemsPerPage):
             # fetch the API
-            try:
-                details = self.fetch(pageNum, self.itemsPerPage)
-            except:
-                raise ErrPagination()
+            details = self._fetch(pageNum, budget, limiter)
 
             # set the real total
             total = details["totalCount"]
 
-            # while into the page results
-            results = details["results"]
-            results_count = len(results)
-            index = 0
-            while (index < results_count):
-                result = results[index]
-                index += 1
-                yield result
+            yield details["results"]
 
             # next page
             pageNum += 1
 
+    def map(self, fn, concurrency=Settings.concurrency, ordered=False):
+        """Call a function on each result as soon as its page is fetched
+
+        eg: atlas.Projects.get_all_projects(iterable=True).map(
+                lambda project: atlas.with_group(project["id"]).DatabaseUsers.get_all_database_users())
+
+        Args:
+            fn (function): Called with each result
+
+        Keyword Args:
+            concurrency (int or AdaptiveLimiter): Fixed concurrency or adaptive limiter
+            ordered (bool): Yield in the order of the results instead of the completion order
+
+        Returns:
+            iterable: MapResult (item, value, error) per result (see concurrency.parallel_map)
+        """
+        return parallel_map(self, fn, concurrency, ordered)
+
+    def map_async(self, fn, concurrency=Settings.concurrency, ordered=False):
+        """Call a function on each result as soon as its page is fetched (asyncio)
+
+        Args:
+            fn (function or coroutine function): Called with each result
+
+        Keyword Args:
+            concurrency (int): Number of calls at once
+            ordered (bool): Yield in the order of the results instead of the completion order
+
+        Returns:
+            async iterable: MapResult (item, value, error) per result (see concurrency.parallel_map_async)
+        """
+        return parallel_map_async(self, fn, concurrency, ordered)
+
+    def sequence(self, cache_pages=Settings.sequence_cache_pages):
+        """Get a lazy random access view of the results
+
+        Keyword Args:
+            cache_pages (int): Number of pages kept in memory
+
+        Returns:
+            AtlasSequence: The view
+        """
+        return AtlasSequence(self, cache_pages)
+
+    def _fetch(self, pageNum, budget, limiter=None, itemsPerPage=None, cache=None):
+        """Fetch one page
+
+        Args:
+            pageNum (int): Page number
+            budget (Deadline): Budget of the walk (or None)
+
+        Keyword Args:
+            limiter (AdaptiveLimiter): Run the fetch in a slot of the limiter
+            itemsPerPage (int): Page size (default to the pagination one)
+            cache (bool): Read the response cache (default to the pagination setting)
+
+        Returns:
+            dict: Response payload
+
+        Raises:
+            ErrPagination: Issue during the fetch
+            ErrDeadlineExceeded: The walk deadline is exceeded
+        """
+        itemsPerPage = itemsPerPage or self.itemsPerPage
+        cache = self.cache if cache is None else cache
+        try:
+            with use(budget):
+                if limiter is None:
+                    return self.fetch(pageNum, itemsPerPage, cache=cache)
+                return limiter.run(lambda: self.fetch(pageNum, itemsPerPage, cache=cache))
+        except ErrDeadlineExceeded:
+            raise
+        except Exception as e:
+            # the cause tells transient issues apart (see waiter)
+            raise ErrPagination() from e
+
+    def _parallel_pages(self, first, total, budget, concurrency):
+        """Fetch pages concurrently
+
+        At most twice the number of threads pages are fetched ahead of the consumer.
+
+        Args:
+            first (int): First page number
+            total (int): Total number of results
+            budget (Deadline): Budget of the walk (or None)
+            concurrency (int or AdaptiveLimiter): Fixed concurrency or adaptive limiter
+
+        Yields:
+            list: Results of one page, in order
+        """
+        last = -(-total // self.itemsPerPage)
+        threads, limiter = workers(concurrency)
+
+        @bind
+        def fetch(pageNum):
+            return self._fetch(pageNum, budget, limiter)["results"]
+
+        executor = ThreadPoolExecutor(max_workers=threads)
+        pending = deque()
+        pageNum = first
+        try:
+            while pending or pageNum <= last:
+                while pageNum <= last and len(pending) < threads * 2:
+                    pending.append(executor.submit(fetch, pageNum))
+                    pageNum += 1
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+
+class AtlasSequence(Sequence):
+    """Lazy random access view of a pagination
+
+    len() costs one request (itemsPerPage=1), indexing and slicing fetch only the pages
+    covering the requested indexes. The last pages used are kept in memory (thread safe).
+    After refresh(), pages are fetched from Atlas, not from the response cache.
+
+    Index 0 is the first result of the pagination pageNum.
+
+    Constructor
+
+    Args:
+        pagination (AtlasPagination): The pagination
+
+    Keyword Args:
+        cache_pages (int): Number of pages kept in memory
+    """
+
+    def __init__(self, pagination, cache_pages=Settings.sequence_cache_pages):
+        self.pagination = pagination
+        self.cache_pages = cache_pages
+        self.offset = (pagination.pageNum - 1) * pagination.itemsPerPage
+
+        self._lock = threading.Lock()
+        self._pages = OrderedDict()
+        self._total = None
+        self._cache = pagination.cache
+
+    def refresh(self):
+        """Forget the length and the cached pages"""
+        with self._lock:
+            self._pages.clear()
+            self._total = None
+            self._cache = False
+
+    def _budget(self):
+        """Get the deadline of one access
+
+        Returns:
+            Deadline: The deadline or None
+        """
+        deadline = self.pagination.deadline
+        return Deadline(deadline) if deadline is not None else None
+
+    def __len__(self):
+        if self._total is None:
+            details = self.pagination._fetch(1, self._budget(), itemsPerPage=1, cache=self._cache)
+            self._total = details["totalCount"]
+
+        return max(0, self._total - self.offset)
+
+    def _page(self, pageNum, budget):
+        """Get the results of a page
+
+        Args:
+            pageNum (int): Page number
+            budget (Deadline): Deadline of the access (or None)
+
+        Returns:
+            list: Results
+        """
+        with self._lock:
+            results = self._pages.get(pageNum)
+            if results is not None:
+                self._pages.move_to_end(pageNum)
+                return results
+
+        details = self.pagination._fetch(pageNum, budget, cache=self._cache)
+        results = details["results"]
+
+        with self._lock:
+            self._total = details["totalCount"]
+            self._pages[pageNum] = results
+            while len(self._pages) > self.cache_pages:
+                self._pages.popitem(last=False)
+
+        return results
+
+    def _item(self, index, budget):
+        """Get one result
+
+        Args:
+            index (int): Positive index
+            budget (Deadline): Deadline of the access (or None)
+
+        Returns:
+            dict: The result
+
+        Raises:
+            IndexError: Out of range
+        """
+        pageNum, position = divmod(self.offset + index, self.pagination.itemsPerPage)
+        results = self._page(pageNum + 1, budget)
+        if position >= len(results):
+            # Results removed since len()
+            raise IndexError("AtlasSequence index out of range")
+        return results[position]
+
+    def __getitem__(self, index):
+        budget = self._budget()
+
+        if isinstance(index, slice):
+            return [self._item(i, budget) for i in range(*index.indices(len(self)))]
+
+        length = len(self)
+        if index < 0:
+            index += length
+        if index < 0 or index >= length:
+            raise IndexError("AtlasSequence index out of range")
+
+        return self._item(index, budget)
+
 
 class DatabaseUsersGetAll(AtlasPagination):
     """Pagination for Database User : Get All"""
 
-    def __init__(self, atlas, pageNum, itemsPerPage):
-        super().__init__(atlas, atlas.DatabaseUsers.get_all_database_users, pageNum, itemsPerPage)
+    def __init__(self, atlas, pageNum, itemsPerPage, deadline=None, cache=True):
+        super().__init__(atlas, atlas.DatabaseUsers.get_all_database_users, pageNum, itemsPerPage, deadline, cache)
 
 
 class WhitelistGetAll(AtlasPagination):
     """Pagination for Database User : Get All"""
 
-    def __init__(self, atlas, pageNum, itemsPerPage):
-        super().__init__(atlas, atlas.Whitelist.get_all_whitelist_entries, pageNum, itemsPerPage)
+    def __init__(self, atlas, pageNum, itemsPerPage, deadline=None, cache=True):
+        super().__init__(atlas, atlas.Whitelist.get_all_whitelist_entries, pageNum, itemsPerPage, deadline, cache)
 
 
 class ProjectsGetAll(AtlasPagination):
     """Pagination for Projects : Get All"""
 
-    def __init__(self, atlas, pageNum, itemsPerPage):
-        super().__init__(atlas, atlas.Projects.get_all_projects, pageNum, itemsPerPage)
+    def __init__(self, atlas, pageNum, itemsPerPage, deadline=None, cache=True):
+        super().__init__(atlas, atlas.Projects.get_all_projects, pageNum, itemsPerPage, deadline, cache)
 
 
 class ClustersGetAll(AtlasPagination):
     """Pagination for Clusters : Get All"""
 
-    def __init__(self, atlas, pageNum, itemsPerPage):
-        super().__init__(atlas, atlas.Clusters.get_all_clusters, pageNum, itemsPerPage)
+    def __init__(self, atlas, pageNum, itemsPerPage, deadline=None, cache=True):
+        super().__init__(atlas, atlas.Clusters.get_all_clusters, pageNum, itemsPerPage, deadline, cache)
 
 
 class AlertsGetAll(AtlasPagination):
     """Pagination for Alerts : Get All"""
 
-    def __init__(self, atlas, status, pageNum, itemsPerPage):
-        super().__init__(atlas, self.fetch, pageNum, itemsPerPage)
+    def __init__(self, atlas, status, pageNum, itemsPerPage, deadline=None, cache=True):
+        super().__init__(atlas, self.fetch, pageNum, itemsPerPage, deadline, cache)
         self.get_all_alerts = atlas.Alerts.get_all_alerts
         self.status = status
 
-    def fetch(self, pageNum, itemsPerPage):
+    def fetch(self, pageNum, itemsPerPage, cache=True):
         """Intermediate fetching
 
         Args:
             pageNum (int): Page number
             itemsPerPage (int): Number of Users per Page
 
+        Keyword Args:
+            cache (bool): Read the response cache
+
         Returns:
             dict: Response payload
         """
-        return self.get_all_alerts(self.status, pageNum, itemsPerPage)
+        return self.get_all_alerts(self.status, pageNum, itemsPerPage, cache=cache)
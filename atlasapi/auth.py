@@ -0,0 +1,83 @@
+# Copyright (c) 2018 Yellow Pages Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Auth module
+
+Digest authentication sharing the server nonce between threads
+"""
+
+import threading
+
+from requests.auth import HTTPDigestAuth
+
+
+class _DigestState:
+    """Digest state: the challenge is shared, the request state is per thread"""
+
+    shared = frozenset(["chal", "last_nonce", "nonce_count"])
+
+    def __init__(self):
+        object.__setattr__(self, "_local", threading.local())
+        object.__setattr__(self, "_shared", {"chal": {}, "last_nonce": "", "nonce_count": 0})
+
+    def __getattr__(self, name):
+        if name in _DigestState.shared:
+            return self._shared[name]
+        return getattr(self._local, name)
+
+    def __setattr__(self, name, value):
+        if name in _DigestState.shared:
+            self._shared[name] = value
+        else:
+            setattr(self._local, name, value)
+
+
+class DigestAuth(HTTPDigestAuth):
+    """HTTP Digest Authentication with a shared nonce
+
+    requests.auth.HTTPDigestAuth keeps the server challenge per thread, so every new
+    thread pays a 401 round trip. Here the challenge (nonce) is shared by all threads
+    and the nonce count is incremented under a lock.
+
+    Constructor
+
+    Args:
+        username (str): user
+        password (str): password
+    """
+
+    def __init__(self, username, password):
+        super().__init__(username, password)
+        self._thread_local = _DigestState()
+        self._lock = threading.Lock()
+
+    def init_per_thread_state(self):
+        # Only the per request state is per thread
+        if not hasattr(self._thread_local._local, "init"):
+            self._thread_local.init = True
+            self._thread_local.pos = None
+            self._thread_local.num_401_calls = None
+
+    def build_digest_header(self, method, url):
+        with self._lock:
+            return super().build_digest_header(method, url)
+
+    def has_nonce(self):
+        """Check if a server nonce is known
+
+        Returns:
+            bool: The next request will be authenticated without a 401 round trip
+        """
+        return bool(self._thread_local.last_nonce)
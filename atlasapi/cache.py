@@ -0,0 +1,247 @@
+# Copyright (c) 2018 Yellow Pages Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Cache module
+
+Persistent cache of GET responses shared by processes
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+from .settings import Settings
+
+
+class ResponseCache:
+    """SQLite cache of GET responses (thread and process safe)
+
+    Entries are keyed by credential identity (an HMAC of user and password, keyed with
+    a random secret stored next to the SQLite file in path + ".key") and URI,
+    expire after a TTL and the least recently used ones are evicted above max_bytes.
+    The size of the cached bodies is kept up to date by triggers, so a put only scans
+    the entries when it crosses max_bytes.
+
+    Constructor
+
+    Args:
+        path (str): SQLite file, shared by the processes
+
+    Keyword Args:
+        ttl (float): Seconds an entry is valid
+        ttls (dict): TTL per endpoint ((resource group, operation) -> seconds)
+        max_bytes (int): Size of the cached bodies before evicting
+    """
+
+    def __init__(self, path, ttl=Settings.cache_ttl, ttls=None, max_bytes=Settings.cache_max_bytes):
+        self.path = path
+        self.ttl = ttl
+        self.ttls = ttls or {}
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._secret = self._load_secret(path + ".key")
+        with self._db() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS entries ("
+                       "identity TEXT, uri TEXT, body BLOB, size INTEGER, expires REAL, accessed REAL, "
+                       "PRIMARY KEY (identity, uri))")
+            db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            db.execute("CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY, bytes INTEGER)")
+            db.execute("INSERT OR IGNORE INTO totals SELECT 0, COALESCE(SUM(size), 0) FROM entries")
+            db.execute("CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN "
+                       "UPDATE totals SET bytes = bytes + new.size WHERE id = 0; END")
+            db.execute("CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN "
+                       "UPDATE totals SET bytes = bytes - old.size WHERE id = 0; END")
+
+    def _db(self):
+        """Get the connection of the current thread (and process)
+
+        Returns:
+            Connection: SQLite connection
+        """
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=Settings.cache_busy_timeout)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            # rows replaced by INSERT OR REPLACE fire the delete trigger
+            db.execute("PRAGMA recursive_triggers=ON")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    @staticmethod
+    def _load_secret(path):
+        """Load the secret of the identities, created on first use
+
+        The secret is written to a private temporary file then linked to its path, so
+        concurrent processes agree on the first one published.
+
+        Args:
+            path (str): Secret file
+
+        Returns:
+            bytes: Secret
+        """
+        if not os.path.exists(path):
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".atlasapi-key")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(os.urandom(Settings.cache_secret_bytes))
+                os.link(tmp, path)
+            except FileExistsError:
+                pass
+            finally:
+                os.unlink(tmp)
+
+        with open(path, "rb") as f:
+            return f.read()
+
+    def identity(self, user, password):
+        """Get the identity of credentials
+
+        The identity is an HMAC keyed with the secret of the cache: the file alone does
+        not allow to check guessed passwords.
+
+        Args:
+            user (str): user
+            password (str): password
+
+        Returns:
+            str: Identity
+        """
+        return hmac.new(self._secret, ("%s\0%s" % (user, password)).encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def get(self, identity, uri):
+        """Get a cached response
+
+        Args:
+            identity (str): Credential identity
+            uri (str): URI
+
+        Returns:
+            dict: Response payload or None
+        """
+        now = time.time()
+        with self._db() as db:
+            row = db.execute("SELECT body FROM entries WHERE identity = ? AND uri = ? AND expires > ?",
+                             (identity, uri, now)).fetchone()
+            if row is not None:
+                db.execute("UPDATE entries SET accessed = ? WHERE identity = ? AND uri = ?", (now, identity, uri))
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if row is None:
+            return None
+        return json.loads(row[0].decode("utf-8"))
+
+    def put(self, identity, uri, details, endpoint=None):
+        """Cache a response
+
+        Args:
+            identity (str): Credential identity
+            uri (str): URI
+            details (dict): Response payload
+
+        Keyword Args:
+            endpoint (tuple): (resource group, operation) to select the TTL
+        """
+        body = json.dumps(details, separators=(",", ":")).encode("utf-8")
+        now = time.time()
+        with self._db() as db:
+            db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                       (identity, uri, body, len(body), now + self.ttls.get(endpoint, self.ttl), now))
+            self._evict(db, now)
+
+    def _evict(self, db, now):
+        """Remove expired entries then the least recently used ones, once above max_bytes
+
+        Args:
+            db (Connection): SQLite connection (in a transaction)
+            now (float): Current time
+        """
+        if self._size(db) <= self.max_bytes:
+            return
+
+        db.execute("DELETE FROM entries WHERE expires <= ?", (now,))
+
+        excess = self._size(db) - self.max_bytes
+        if excess <= 0:
+            return
+
+        evicted = []
+        for identity, uri, size in db.execute("SELECT identity, uri, size FROM entries ORDER BY accessed"):
+            evicted.append((identity, uri))
+            excess -= size
+            if excess <= 0:
+                break
+        db.executemany("DELETE FROM entries WHERE identity = ? AND uri = ?", evicted)
+
+    @staticmethod
+    def _size(db):
+        """Get the size of the cached bodies
+
+        Args:
+            db (Connection): SQLite connection
+
+        Returns:
+            int: Bytes
+        """
+        return db.execute("SELECT bytes FROM totals WHERE id = 0").fetchone()[0]
+
+    def invalidate(self, uri):
+        """Forget the responses of the resource collection of a URI (for all identities)
+
+        eg: /api/atlas/v1.0/groups/<group>/clusters/<name> invalidates all the
+        /api/atlas/v1.0/groups/<group>/clusters... responses.
+
+        Args:
+            uri (str): URI of a mutation
+        """
+        url = urlsplit(uri)
+        prefix = "%s://%s%s" % (url.scheme, url.netloc, "/".join(url.path.split("/")[:7]).rstrip("/"))
+        with self._db() as db:
+            db.execute("DELETE FROM entries WHERE substr(uri, 1, ?) = ?", (len(prefix), prefix))
+
+    def clear(self):
+        """Forget all responses"""
+        with self._db() as db:
+            db.execute("DELETE FROM entries")
+
+    def stats(self):
+        """Get the cache statistics
+
+        Returns:
+            dict: "hits" and "misses" of this process, "entries" and "bytes" in the cache
+        """
+        with self._db() as db:
+            entries = db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            size = self._size(db)
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
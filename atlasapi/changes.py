@@ -0,0 +1,204 @@
+# Copyright (c) 2018 Yellow Pages Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Changes module
+
+Detect changes between successive "Get All" walks with content hashes
+"""
+
+import hashlib
+import json
+import os
+import struct
+from collections import namedtuple
+
+ChangeEvent = namedtuple("ChangeEvent", ["type", "id", "item"])
+ChangeEvent.__doc__ = """A change between 2 walks
+
+type (str): ADDED, MODIFIED or REMOVED
+id (str): Item id
+item (dict): The item (None when REMOVED)
+"""
+
+ADDED = "added"
+MODIFIED = "modified"
+REMOVED = "removed"
+
+
+def canonical(item, mask=()):
+    """Canonical JSON encoding of an item
+
+    Args:
+        item (dict): The item
+
+    Keyword Args:
+        mask (iterable of str): Dotted paths of fields to ignore (eg: "updated", "replicationSpec.lastUpdate")
+
+    Returns:
+        bytes: The encoding
+    """
+    if mask:
+        item = _masked(item, [path.split(".") for path in mask])
+
+    return json.dumps(item, sort_keys=True, separators=(",", ":")).encode()
+
+
+def canonical_hash(item, mask=()):
+    """Stable hash of an item
+
+    Args:
+        item (dict): The item
+
+    Keyword Args:
+        mask (iterable of str): Dotted paths of fields to ignore (see canonical)
+
+    Returns:
+        bytes: 16 bytes digest
+    """
+    return hashlib.blake2b(canonical(item, mask), digest_size=16).digest()
+
+
+def _masked(item, paths):
+    """Copy of an item without some fields
+
+    Only the dicts on the masked paths are copied.
+
+    Args:
+        item (dict): The item
+        paths (list of list of str): Splitted dotted paths
+
+    Returns:
+        dict: The masked item
+    """
+    item = dict(item)
+    nested = {}
+
+    for path in paths:
+        if len(path) == 1:
+            item.pop(path[0], None)
+        else:
+            nested.setdefault(path[0], []).append(path[1:])
+
+    for field, subpaths in nested.items():
+        if isinstance(item.get(field), dict):
+            item[field] = _masked(item[field], subpaths)
+
+    return item
+
+
+class ChangeDetector:
+    """Detect changes between successive walks
+
+    Only a compact id -> hash map of the previous walk is kept (in memory and optionally on disk),
+    so the memory is proportional to the number of ids.
+
+    Constructor
+
+    Keyword Args:
+        key (str or function): Id field of items or function returning the id of an item
+        mask (iterable of str): Dotted paths of volatile fields to ignore
+        path (str): File used to persist the id -> hash map between runs
+    """
+
+    MAGIC = b"ATLCHG1\n"
+
+    def __init__(self, key="id", mask=(), path=None):
+        self.key = key if callable(key) else (lambda item: item[key])
+        self.mask = tuple(mask)
+        self.path = path
+        self.hashes = self.load(path) if path and os.path.exists(path) else {}
+
+    def diff(self, items):
+        """Compare a walk with the previous one
+
+        The id -> hash map is replaced once the walk is fully consumed. An id seen twice
+        in the walk is reported once (again as MODIFIED if its content changed).
+
+        Args:
+            items (iterable of dict): A walk (eg: AtlasPagination)
+
+        Yields:
+            ChangeEvent: ADDED and MODIFIED events while walking then REMOVED events
+        """
+        previous = dict(self.hashes)
+        current = {}
+
+        for item in items:
+            item_id = str(self.key(item))
+            h = canonical_hash(item, self.mask)
+
+            # Offset paging may return an item twice when the list shifts during the walk
+            if item_id in current:
+                old = current[item_id]
+            else:
+                old = previous.pop(item_id, None)
+            current[item_id] = h
+
+            if old is None:
+                yield ChangeEvent(ADDED, item_id, item)
+            elif old != h:
+                yield ChangeEvent(MODIFIED, item_id, item)
+
+        for item_id in previous:
+            yield ChangeEvent(REMOVED, item_id, None)
+
+        self.hashes = current
+
+    def save(self, path=None):
+        """Persist the id -> hash map
+
+        Keyword Args:
+            path (str): File (default: the constructor path)
+        """
+        path = path or self.path
+        tmp = path + ".tmp"
+
+        with open(tmp, "wb") as f:
+            f.write(ChangeDetector.MAGIC)
+            for item_id, h in self.hashes.items():
+                encoded = item_id.encode()
+                f.write(struct.pack(">H", len(encoded)))
+                f.write(encoded)
+                f.write(h)
+
+        os.replace(tmp, path)
+
+    @staticmethod
+    def load(path):
+        """Load a persisted id -> hash map
+
+        Args:
+            path (str): File
+
+        Returns:
+            dict: id -> hash
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+
+        if not data.startswith(ChangeDetector.MAGIC):
+            raise ValueError("%s is not a change detector file" % path)
+
+        hashes = {}
+        pos = len(ChangeDetector.MAGIC)
+        while pos < len(data):
+            size, = struct.unpack_from(">H", data, pos)
+            pos += 2
+            item_id = data[pos:pos + size].decode()
+            pos += size
+            hashes[item_id] = data[pos:pos + 16]
+            pos += 16
+
+        return hashes
@@ -0,0 +1,186 @@
+# Copyright (c) 2018 Yellow Pages Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Circuit Breaker module
+
+Fail fast on endpoints which are unhealthy
+"""
+
+import threading
+import time
+from collections import deque
+
+from .errors import ErrCircuitOpen
+from .settings import Settings
+
+
+class CircuitBreaker:
+    """Circuit breaker for one endpoint
+
+    The circuit opens when the failure rate over the last `window` seconds reaches
+    `failure_rate` (with at least `min_calls` calls). After `reset_timeout` seconds,
+    it becomes half-open and lets `probes` requests go through: the circuit closes
+    if they all succeed and opens again on the first failure.
+
+    Constructor
+
+    Args:
+        endpoint (tuple): (resource group, operation)
+
+    Keyword Args:
+        failure_rate (float): Failure rate (0 to 1) which opens the circuit
+        min_calls (int): Minimum number of calls in the window before opening the circuit
+        window (float): Seconds of history used to compute the failure rate
+        reset_timeout (float): Seconds before trying again an open circuit
+        probes (int): Number of successful probes needed to close a half-open circuit
+        on_state_change (function): Called with (endpoint, state) when the state changes
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, endpoint, failure_rate=Settings.circuit_failure_rate, min_calls=Settings.circuit_min_calls,
+                 window=Settings.circuit_window, reset_timeout=Settings.circuit_reset_timeout,
+                 probes=Settings.circuit_probes, on_state_change=None):
+        self.endpoint = endpoint
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.probes = probes
+        self.on_state_change = on_state_change
+
+        self.state = CircuitBreaker.CLOSED
+
+        self._lock = threading.Lock()
+        self._calls = deque()
+        self._failures = 0
+        self._opened_at = 0
+        self._probes_running = 0
+        self._probes_succeeded = 0
+
+    def before(self):
+        """Check if a call is allowed
+
+        Raises:
+            ErrCircuitOpen: The circuit is open
+        """
+        with self._lock:
+            if self.state == CircuitBreaker.OPEN:
+                retry_after = self._opened_at + self.reset_timeout - time.monotonic()
+                if retry_after > 0:
+                    raise ErrCircuitOpen(self.endpoint, retry_after)
+                self._set_state(CircuitBreaker.HALF_OPEN)
+
+            if self.state == CircuitBreaker.HALF_OPEN:
+                if self._probes_running + self._probes_succeeded >= self.probes:
+                    raise ErrCircuitOpen(self.endpoint, 0)
+                self._probes_running += 1
+
+    def record(self, success):
+        """Record the outcome of a call allowed by before()
+
+        Args:
+            success (bool): The call succeeded (None when the outcome says nothing about the endpoint)
+        """
+        with self._lock:
+            now = time.monotonic()
+
+            if self.state == CircuitBreaker.HALF_OPEN:
+                self._probes_running -= 1
+                if success is None:
+                    return
+                elif not success:
+                    self._open(now)
+                else:
+                    self._probes_succeeded += 1
+                    if self._probes_succeeded >= self.probes:
+                        self._set_state(CircuitBreaker.CLOSED)
+                return
+
+            if self.state == CircuitBreaker.OPEN or success is None:
+                # Call started before the circuit opened or neutral outcome
+                return
+
+            self._calls.append((now, success))
+            if not success:
+                self._failures += 1
+
+            while self._calls and self._calls[0][0] < now - self.window:
+                if not self._calls.popleft()[1]:
+                    self._failures -= 1
+
+            if len(self._calls) >= self.min_calls and self._failures >= self.failure_rate * len(self._calls):
+                self._open(now)
+
+    def _open(self, now):
+        """Open the circuit"""
+        self._opened_at = now
+        self._set_state(CircuitBreaker.OPEN)
+
+    def _set_state(self, state):
+        """Change the state and reset the counters"""
+        self.state = state
+        self._calls.clear()
+        self._failures = 0
+        self._probes_running = 0
+        self._probes_succeeded = 0
+
+        if self.on_state_change:
+            self.on_state_change(self.endpoint, state)
+
+
+class CircuitBreakers:
+    """Circuit breakers keyed by endpoint
+
+    Keyword arguments are used to create each CircuitBreaker (see CircuitBreaker).
+    State changes are reported through the Network hooks.
+    """
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def get(self, endpoint, on_state_change=None):
+        """Get the circuit breaker of an endpoint
+
+        Args:
+            endpoint (tuple): (resource group, operation)
+
+        Keyword Args:
+            on_state_change (function): Used when the circuit breaker is created
+
+        Returns:
+            CircuitBreaker: The circuit breaker
+        """
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(endpoint)
+                if breaker is None:
+                    breaker = CircuitBreaker(endpoint, on_state_change=on_state_change, **self.kwargs)
+                    self._breakers[endpoint] = breaker
+
+        return breaker
+
+    def states(self):
+        """Get the state of all circuit breakers
+
+        Returns:
+            dict: endpoint -> state
+        """
+        return {endpoint: breaker.state for endpoint, breaker in list(self._breakers.items())}
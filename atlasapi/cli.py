@@ -0,0 +1,340 @@
+# Copyright (c) 2018 Yellow Pages Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+CLI module
+
+atlasapi console script. Results are written as JSON lines on stdout.
+
+Only the standard library is imported at startup, the Atlas client is
+imported when a command runs.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+
+class Metrics:
+    """Collect request metrics through the Network hooks"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self.endpoints = {}
+        self.errors = 0
+        self.wire_bytes = 0
+        self.body_bytes = 0
+        self.limit = None
+        self.decisions = {}
+        self.cache_hits = 0
+
+    def hook(self, event, data):
+        """Network hook
+
+        Args:
+            event (str): Event name
+            data (dict): Event details
+        """
+        if event == "concurrency":
+            with self._lock:
+                self.limit = data["limit"]
+                self.decisions[data["reason"]] = self.decisions.get(data["reason"], 0) + 1
+            return
+
+        if event == "cache":
+            with self._lock:
+                self.cache_hits += 1
+            return
+
+        if event != "request":
+            return
+
+        name = " / ".join(data["endpoint"]) if data["endpoint"] else data["method"]
+        with self._lock:
+            count, elapsed = self.endpoints.get(name, (0, 0))
+            self.endpoints[name] = (count + 1, elapsed + data["elapsed"])
+            if data["error"] is not None:
+                self.errors += 1
+            self.wire_bytes += data.get("wire_bytes", 0)
+            self.body_bytes += data.get("body_bytes", 0)
+
+    def report(self, out, items):
+        """Write a summary
+
+        Args:
+            out (file): Output
+            items (int): Number of results written
+        """
+        total = sum(count for count, _ in self.endpoints.values())
+        out.write("# %d results, %d requests, %d errors in %.3fs\n" % (
+            items, total, self.errors, time.monotonic() - self.started))
+        out.write("# %d bytes received (%d decompressed)\n" % (self.wire_bytes, self.body_bytes))
+        if self.cache_hits:
+            out.write("# %d responses from the cache\n" % self.cache_hits)
+        for name, (count, elapsed) in sorted(self.endpoints.items()):
+            out.write("#   %-45s %6d requests  avg %.3fs\n" % (name, count, elapsed / count))
+        if self.limit is not None:
+            out.write("# concurrency limit %d (%s)\n" % (
+                self.limit, ", ".join("%s: %d" % item for item in sorted(self.decisions.items()))))
+
+
+def _select(item, fields):
+    """Keep some fields of an item
+
+    Args:
+        item (dict): The item
+        fields (list of str): Dotted paths
+
+    Returns:
+        dict: Dotted path -> value
+    """
+    if not fields:
+        return item
+
+    selected = {}
+    for field in fields:
+        value = item
+        for key in field.split("."):
+            value = value.get(key) if isinstance(value, dict) else None
+        selected[field] = value
+    return selected
+
+
+def _list(args, atlas, fetch):
+    """Walk a listing on the current group or on all groups
+
+    Args:
+        args (Namespace): Arguments
+        atlas (Atlas): Atlas instance
+        fetch (function): Called with an Atlas instance, returns the walk
+
+    Returns:
+        iterable: Results
+    """
+    if not args.all_groups:
+        return fetch(atlas)
+
+    from .concurrency import fan_out
+
+    groups = [project["id"] for project in atlas.Projects.get_all_projects(iterable=True)]
+    return fan_out(atlas, groups, fetch, args.limiter or args.concurrency)
+
+
+def _acknowledge(args, atlas):
+    """Acknowledge alerts by ids or by status
+
+    Args:
+        args (Namespace): Arguments
+        atlas (Atlas): Atlas instance
+
+    Yields:
+        dict: One result per alert
+    """
+    from datetime import datetime, timedelta, timezone
+
+    until = datetime.now(timezone.utc) + timedelta(hours=args.hours)
+    report = atlas.Alerts.acknowledge_alerts(args.status or args.ids, until, args.comment, args.concurrency)
+
+    for alert_id, result in report.items():
+        details = result["details"]
+        if isinstance(details, Exception):
+            details = "%s: %s" % (type(details).__name__, details)
+        yield {"id": alert_id, "status": result["status"], "details": details}
+
+
+def _commands():
+    """Commands table
+
+    Returns:
+        dict: (resource, action) -> function(args, atlas) returning a result or an iterable of results
+    """
+    return {
+        ("clusters", "list"): lambda args, a: _list(args, a, lambda g: g.Clusters.get_all_clusters(iterable=True)),
+        ("clusters", "get"): lambda args, a: a.Clusters.get_a_single_cluster(args.name),
+        ("clusters", "delete"): lambda args, a: a.Clusters.delete_a_cluster(args.name, areYouSure=args.yes),
+        ("clusters", "wait"): lambda args, a: a.Clusters.wait_for_state(args.names, args.state, args.wait_timeout),
+        ("whitelist", "list"): lambda args, a: _list(
+            args, a, lambda g: g.Whitelist.get_all_whitelist_entries(iterable=True)),
+        ("whitelist", "get"): lambda args, a: a.Whitelist.get_whitelist_entry(args.ip),
+        ("whitelist", "create"): lambda args, a: a.Whitelist.create_whitelist_entry(args.ip, args.comment),
+        ("whitelist", "delete"): lambda args, a: a.Whitelist.delete_a_whitelist_entry(args.ip),
+        ("users", "list"): lambda args, a: _list(
+            args, a, lambda g: g.DatabaseUsers.get_all_database_users(iterable=True)),
+        ("users", "get"): lambda args, a: a.DatabaseUsers.get_a_single_database_user(args.username),
+        ("users", "delete"): lambda args, a: a.DatabaseUsers.delete_a_database_user(args.username),
+        ("projects", "list"): lambda args, a: a.Projects.get_all_projects(iterable=True),
+        ("projects", "get"): lambda args, a: a.Projects.get_one_project(args.id),
+        ("projects", "create"): lambda args, a: a.Projects.create_a_project(args.name, args.org),
+        ("alerts", "list"): lambda args, a: _list(
+            args, a, lambda g: g.Alerts.get_all_alerts(args.status, iterable=True)),
+        ("alerts", "get"): lambda args, a: a.Alerts.get_an_alert(args.id),
+        ("alerts", "ack"): _acknowledge,
+    }
+
+
+def parser():
+    """Build the arguments parser
+
+    Returns:
+        ArgumentParser: The parser
+    """
+    p = argparse.ArgumentParser(prog="atlasapi", description="MongoDB Atlas APIs")
+    p.add_argument("--user", default=os.environ.get("ATLAS_USER"), help="Atlas user (env: ATLAS_USER)")
+    p.add_argument("--password", default=os.environ.get("ATLAS_PASSWORD"),
+                   help="Atlas password or API key (env: ATLAS_PASSWORD)")
+    p.add_argument("--group", default=os.environ.get("ATLAS_GROUP"), help="Atlas group (env: ATLAS_GROUP)")
+    p.add_argument("--project", default=os.environ.get("ATLAS_PROJECT"),
+                   help="Atlas project name, instead of --group (env: ATLAS_PROJECT)")
+    p.add_argument("--cache", default=os.environ.get("ATLAS_CACHE"),
+                   help="SQLite file caching GET responses between runs (env: ATLAS_CACHE)")
+    p.add_argument("--all-groups", action="store_true", help="List on all groups visible by the user")
+    p.add_argument("--concurrency", type=int, default=10, help="Concurrent requests for bulk commands")
+    p.add_argument("--adaptive", action="store_true",
+                   help="Adapt the concurrency of --all-groups listings (up to --concurrency) to 429/5xx and latency")
+    p.add_argument("--fields", type=lambda v: v.split(","), default=None,
+                   help="Comma separated dotted paths to output (eg: name,providerSettings.instanceSizeName)")
+    p.add_argument("--timeout", type=float, default=None, help="Requests timeout (seconds)")
+    p.add_argument("--deadline", type=float, default=None, help="Deadline of the whole command (seconds)")
+    p.add_argument("--metrics", action="store_true", help="Write a timing summary on stderr")
+
+    resources = p.add_subparsers(dest="resource")
+    resources.required = True
+
+    def resource(name):
+        sub = resources.add_parser(name).add_subparsers(dest="action")
+        sub.required = True
+        return sub
+
+    clusters = resource("clusters")
+    clusters.add_parser("list")
+    clusters.add_parser("get").add_argument("name")
+    delete = clusters.add_parser("delete")
+    delete.add_argument("name")
+    delete.add_argument("--yes", action="store_true", help="Confirm the deletion")
+    wait = clusters.add_parser("wait")
+    wait.add_argument("names", nargs="+")
+    wait.add_argument("--state", action="append", required=True, help="Accepted state (repeatable)")
+    wait.add_argument("--wait-timeout", type=float, default=None, help="Maximum seconds to wait")
+
+    whitelist = resource("whitelist")
+    whitelist.add_parser("list")
+    whitelist.add_parser("get").add_argument("ip")
+    create = whitelist.add_parser("create")
+    create.add_argument("ip")
+    create.add_argument("--comment", default="")
+    whitelist.add_parser("delete").add_argument("ip")
+
+    users = resource("users")
+    users.add_parser("list")
+    users.add_parser("get").add_argument("username")
+    users.add_parser("delete").add_argument("username")
+
+    projects = resource("projects")
+    projects.add_parser("list")
+    projects.add_parser("get").add_argument("id")
+    create = projects.add_parser("create")
+    create.add_argument("name")
+    create.add_argument("--org", default=None)
+
+    alerts = resource("alerts")
+    alerts.add_parser("list").add_argument("--status", default=None)
+    alerts.add_parser("get").add_argument("id")
+    ack = alerts.add_parser("ack")
+    ack.add_argument("ids", nargs="*")
+    ack.add_argument("--status", default=None, help="Acknowledge all alerts with this status")
+    ack.add_argument("--hours", type=float, default=24, help="Acknowledge for this number of hours")
+    ack.add_argument("--comment", default=None)
+
+    return p
+
+
+def main(argv=None):
+    """Console script entry point
+
+    Keyword Args:
+        argv (list of str): Arguments (default: sys.argv)
+
+    Returns:
+        int: Exit code
+    """
+    p = parser()
+    args = p.parse_args(argv)
+
+    if (args.resource, args.action) == ("alerts", "ack") and bool(args.ids) == bool(args.status):
+        p.error("alerts ack: give alert ids or --status (not both)")
+
+    if not args.user or not args.password:
+        sys.stderr.write("atlasapi: --user and --password (or ATLAS_USER and ATLAS_PASSWORD) are required\n")
+        return 2
+
+    if args.resource != "projects" and not args.group and not args.project \
+            and not (args.all_groups and args.action == "list"):
+        sys.stderr.write("atlasapi: --group or --project (or ATLAS_GROUP or ATLAS_PROJECT) is required\n")
+        return 2
+
+    from .atlas import Atlas
+    from .deadline import within
+
+    cache = None
+    if args.cache:
+        from .cache import ResponseCache
+        cache = ResponseCache(args.cache)
+
+    atlas = Atlas(args.user, args.password, args.group, timeout=args.timeout, cache=cache)
+    metrics = Metrics()
+    atlas.network.add_hook(metrics.hook)
+
+    args.limiter = None
+    if args.adaptive:
+        from .concurrency import AdaptiveLimiter
+        args.limiter = AdaptiveLimiter(maximum=args.concurrency).attach(atlas.network)
+
+    out = sys.stdout
+    written = 0
+    code = 0
+
+    try:
+        with within(args.deadline):
+            if args.project and not args.group:
+                atlas.group = atlas.Projects.get_one_project_by_name(args.project)["id"]
+
+            result = _commands()[(args.resource, args.action)](args, atlas)
+
+            if isinstance(result, dict):
+                result = [result]
+
+            for item in result:
+                out.write(json.dumps(_select(item, args.fields), separators=(",", ":")) + "\n")
+                written += 1
+    except KeyboardInterrupt:
+        code = 130
+    except BrokenPipeError:
+        # eg: | head, silence the flush at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), out.fileno())
+    except Exception as e:
+        sys.stderr.write("atlasapi: %s: %s\n" % (type(e).__name__, e))
+        code = 1
+
+    if args.metrics:
+        metrics.report(sys.stderr, written)
+
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
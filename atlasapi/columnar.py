@@ -0,0 +1,254 @@
+# Copyright (c) 2018 Yellow Pages Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Columnar module
+
+Turn "Get All" results into typed columns.
+
+NumPy, pandas and pyarrow are optional: they are only needed by to_numpy(),
+to_pandas() and to_arrow().
+"""
+
+from array import array
+
+
+class ColumnarExport:
+    """Columnar buffers built page by page
+
+    Each column is a flattened path (eg: "providerSettings.instanceSizeName") with a type:
+
+    - "int": 64 bits integers
+    - "float": 64 bits floats
+    - "bool": booleans
+    - "str": any value kept as is
+
+    Missing or invalid values are nulls (see validity()).
+
+    Constructor
+
+    Args:
+        schema (dict or list of tuple): Path -> type
+    """
+
+    typecodes = {"int": "q", "float": "d", "bool": "b"}
+
+    def __init__(self, schema):
+        self.schema = list(schema.items() if isinstance(schema, dict) else schema)
+
+        self._paths = [tuple(path.split(".")) for path, _ in self.schema]
+        self._columns = []
+        self._valid = []
+        for path, kind in self.schema:
+            if kind == "str":
+                self._columns.append([])
+            elif kind in ColumnarExport.typecodes:
+                self._columns.append(array(ColumnarExport.typecodes[kind]))
+            else:
+                raise ValueError("Unsupported type [%s] for [%s]" % (kind, path))
+            self._valid.append(bytearray())
+
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def consume(self, source):
+        """Append all results of a walk
+
+        Args:
+            source (AtlasPagination or iterable of dict): Results. AtlasPagination is consumed page by page.
+
+        Returns:
+            ColumnarExport: self
+        """
+        if hasattr(source, "pages"):
+            for results in source.pages():
+                self.extend(results)
+        else:
+            self.extend(list(source))
+
+        return self
+
+    def extend(self, items):
+        """Append a page of results
+
+        Args:
+            items (list of dict): Results
+        """
+        for (_, kind), path, column, valid in zip(self.schema, self._paths, self._columns, self._valid):
+            values = [_lookup(item, path) for item in items]
+
+            if kind == "str":
+                column.extend(values)
+                valid.extend(v is not None for v in values)
+                continue
+
+            convert = _converters[kind]
+            converted = []
+            for value in values:
+                try:
+                    converted.append(convert(value))
+                    valid.append(1)
+                except (TypeError, ValueError):
+                    converted.append(_nulls[kind])
+                    valid.append(0)
+
+            column.extend(converted)
+
+        self._size += len(items)
+
+    def columns(self):
+        """Get the buffers
+
+        Returns:
+            dict: Path -> array.array (list for "str")
+        """
+        return {path: column for (path, _), column in zip(self.schema, self._columns)}
+
+    def validity(self):
+        """Get the validity masks
+
+        Returns:
+            dict: Path -> bytearray (1 for a value, 0 for a null)
+        """
+        return {path: valid for (path, _), valid in zip(self.schema, self._valid)}
+
+    def to_numpy(self):
+        """Convert to NumPy arrays
+
+        Columns with nulls are masked arrays ("float" uses NaN instead).
+
+        Returns:
+            dict: Path -> numpy array
+        """
+        np = _require("numpy", "numpy")
+
+        out = {}
+        for path, kind, values, mask in self._numpy_columns(np):
+            if kind != "float" and mask.any():
+                values = np.ma.masked_array(values, mask=mask)
+            out[path] = values
+
+        return out
+
+    def to_pandas(self):
+        """Convert to a pandas DataFrame
+
+        Integer and boolean columns with nulls use pandas nullable types.
+
+        Returns:
+            pandas.DataFrame: One row per result, one column per path
+        """
+        pd = _require("pandas", "pandas")
+        np = _require("numpy", "pandas")
+
+        data = {}
+        for path, kind, values, mask in self._numpy_columns(np):
+            if kind == "int" and mask.any():
+                values = pd.arrays.IntegerArray(values, mask)
+            elif kind == "bool" and mask.any():
+                values = pd.arrays.BooleanArray(values, mask)
+            data[path] = values
+
+        return pd.DataFrame(data, columns=[path for path, _ in self.schema])
+
+    def to_arrow(self):
+        """Convert to a pyarrow Table
+
+        Returns:
+            pyarrow.Table: One row per result, one column per path
+        """
+        pa = _require("pyarrow", "arrow")
+        np = _require("numpy", "arrow")
+
+        arrays = []
+        for path, kind, values, mask in self._numpy_columns(np):
+            if kind == "str":
+                arrays.append(pa.array(values, type=pa.string() if _all_str(values) else None, from_pandas=True))
+            else:
+                arrays.append(pa.array(values, mask=mask if mask.any() else None))
+
+        return pa.Table.from_arrays(arrays, names=[path for path, _ in self.schema])
+
+    def _numpy_columns(self, np):
+        """Copy the buffers into NumPy arrays
+
+        Args:
+            np (module): numpy
+
+        Yields:
+            str, str, numpy.ndarray, numpy.ndarray: Path, type, values and null mask
+        """
+        for (path, kind), column, valid in zip(self.schema, self._columns, self._valid):
+            # copy: array.array can't grow while a buffer is exported
+            if kind == "str":
+                values = np.array(column, dtype=object)
+            elif kind == "bool":
+                values = np.frombuffer(column, dtype=np.int8).astype(bool)
+            else:
+                values = np.frombuffer(column, dtype=column.typecode).copy()
+
+            mask = np.frombuffer(valid, dtype=np.uint8) == 0
+            yield path, kind, values, mask
+
+
+def _lookup(item, path):
+    """Get a flattened path
+
+    Args:
+        item (dict): The item
+        path (tuple of str): Path
+
+    Returns:
+        The value or None
+    """
+    for key in path:
+        if not isinstance(item, dict):
+            return None
+        item = item.get(key)
+    return item
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    raise TypeError(value)
+
+
+_converters = {"int": int, "float": float, "bool": _to_bool}
+_nulls = {"int": 0, "float": float("nan"), "bool": False}
+
+
+def _all_str(values):
+    return all(v is None or isinstance(v, str) for v in values)
+
+
+def _require(module, extra):
+    """Import an optional dependency
+
+    Args:
+        module (str): Module name
+        extra (str): setup.py extra which provides it
+
+    Returns:
+        module: The module
+
+    Raises:
+        ImportError: Not installed
+    """
+    try:
+        return __import__(module)
+    except ImportError:
+        raise ImportError("%s is required, please install atlasapi[%s]" % (module, extra))
@@ -0,0 +1,111 @@
+# Copyright (c) 2018 Yellow Pages Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compression module
+
+Response compression negotiation and wire-size accounting.
+
+brotli is used when the optional brotli package is installed.
+"""
+
+import threading
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def accept_encoding():
+    """Value of the Accept-Encoding header
+
+    Returns:
+        str: Supported encodings
+    """
+    return "gzip, deflate, br" if brotli else "gzip, deflate"
+
+
+def decode(raw, content_encoding):
+    """Decompress a response body
+
+    Args:
+        raw (bytes): Body as received
+        content_encoding (str): Value of the Content-Encoding header (None for identity)
+
+    Returns:
+        bytes: Decompressed body
+    """
+    if not content_encoding:
+        return raw
+
+    # Encodings are listed in the order they were applied
+    for encoding in reversed([e.strip().lower() for e in content_encoding.split(",")]):
+        if encoding == "gzip" or encoding == "x-gzip":
+            raw = zlib.decompress(raw, 16 + zlib.MAX_WBITS)
+        elif encoding == "deflate":
+            try:
+                raw = zlib.decompress(raw)
+            except zlib.error:
+                # raw deflate stream without zlib header
+                raw = zlib.decompress(raw, -zlib.MAX_WBITS)
+        elif encoding == "br" and brotli:
+            raw = brotli.decompress(raw)
+        elif encoding not in ("identity", ""):
+            raise ValueError("Unsupported Content-Encoding [%s]" % content_encoding)
+
+    return raw
+
+
+class TransferStats:
+    """Wire and decompressed bytes per endpoint (thread safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, endpoint, wire_bytes, body_bytes):
+        """Record one response
+
+        Args:
+            endpoint (tuple): (resource group, operation) or None
+            wire_bytes (int): Bytes received (compressed)
+            body_bytes (int): Bytes after decompression
+        """
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, [0, 0, 0])
+            stats[0] += 1
+            stats[1] += wire_bytes
+            stats[2] += body_bytes
+
+    def summary(self):
+        """Get the statistics
+
+        Returns:
+            dict: endpoint -> dict with "responses", "wire_bytes", "body_bytes" and "ratio" (wire / body)
+        """
+        with self._lock:
+            items = [(endpoint, list(stats)) for endpoint, stats in self._stats.items()]
+
+        return {endpoint: {"responses": responses,
+                           "wire_bytes": wire,
+                           "body_bytes": body,
+                           "ratio": wire / body if body else 1.0}
+                for endpoint, (responses, wire, body) in items}
+
+    def reset(self):
+        """Reset the statistics"""
+        with self._lock:
+            self._stats.clear()
@@ -0,0 +1,564 @@
+# Copyright (c) 2018 Yellow Pages Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Concurrency module
+
+Helpers used by bulk operations
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from .deadline import bind
+from .errors import ErrAtlasGeneric, ErrDeadlineExceeded
+from .settings import Settings
+
+
+class RateLimiter:
+    """Token bucket rate limiter (thread safe)
+
+    Constructor
+
+    Args:
+        rate (float): Number of operations per second
+
+    Keyword Args:
+        burst (int): Number of operations allowed at once
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+
+        self._lock = threading.Lock()
+        self._tokens = burst
+        self._last = time.monotonic()
+
+    def acquire(self):
+        """Wait until an operation is allowed"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+
+            # Reserve the token even if we need to wait for it
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+
+        if wait > 0:
+            time.sleep(wait)
+
+
+class AdaptiveLimiter:
+    """Adaptive concurrency limiter (AIMD, thread safe)
+
+    The limit grows by one per limit successful requests (about one per round trip)
+    and is multiplied by backoff on 429, 5xx, network issues or when the latency goes
+    above latency_factor times its smoothed baseline. One decrease at most per
+    baseline latency, as requests in flight were sent before the previous decrease.
+
+    Measurements come from the Network hooks (see attach()). Decisions are emitted as
+    "concurrency" events with limit and reason ("increase", "throttled", "error" or "latency").
+
+    Use it as a context manager around each operation (it waits for a free slot) or
+    call run() to also retry throttled operations.
+
+    Constructor
+
+    Keyword Args:
+        initial (int): Initial limit
+        minimum (int): Lowest limit
+        maximum (int): Highest limit
+        backoff (float): Multiplicative decrease
+        latency_factor (float): Latency spike threshold relative to the baseline
+        retries (int): Retries of a throttled operation by run()
+    """
+
+    def __init__(self, initial=Settings.concurrency, minimum=Settings.adaptive_min_concurrency,
+                 maximum=Settings.adaptive_max_concurrency, backoff=Settings.adaptive_backoff,
+                 latency_factor=Settings.adaptive_latency_factor, retries=Settings.adaptive_retries):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.latency_factor = latency_factor
+        self.retries = retries
+
+        self.network = None
+        self.increases = 0
+        self.decreases = 0
+
+        self._cond = threading.Condition()
+        self._limit = float(max(minimum, min(initial, maximum)))
+        self._in_flight = 0
+        self._baseline = None
+        self._decreased_at = 0.0
+
+    @property
+    def limit(self):
+        """Current limit
+
+        Returns:
+            int: Maximum number of operations at once
+        """
+        return int(self._limit)
+
+    def attach(self, network):
+        """Drive the limiter with the requests of a network
+
+        Args:
+            network (Network): Network (eg: atlas.network)
+
+        Returns:
+            AdaptiveLimiter: self
+        """
+        self.network = network
+        network.add_hook(self.hook)
+        return self
+
+    def acquire(self):
+        """Wait for a free slot"""
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                self._cond.wait()
+            self._in_flight += 1
+
+    def release(self):
+        """Give back a slot"""
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def run(self, fn, *args):
+        """Run an operation in a slot
+
+        A throttled operation (429) is retried once the limit is decreased.
+
+        Args:
+            fn (function): The operation
+            *args: Arguments of the operation
+
+        Returns:
+            The operation result
+        """
+        attempt = 0
+        while True:
+            with self:
+                try:
+                    return fn(*args)
+                except ErrAtlasGeneric as e:
+                    if e.getAtlasResponse()[0] != Settings.TOO_MANY_REQUESTS or attempt >= self.retries:
+                        raise
+            attempt += 1
+            time.sleep(self._baseline or 0)
+
+    def hook(self, event, data):
+        """Network hook
+
+        Args:
+            event (str): Event name
+            data (dict): Event details
+        """
+        if event != "request" or isinstance(data["error"], ErrDeadlineExceeded):
+            return
+
+        status = data["status"]
+        elapsed = data["elapsed"]
+
+        if status == Settings.TOO_MANY_REQUESTS:
+            self.record(False, elapsed, "throttled")
+        elif status is None or status >= Settings.SERVER_ERRORS:
+            self.record(False, elapsed, "error")
+        else:
+            self.record(True, elapsed)
+
+    def record(self, success, elapsed, reason=None):
+        """Record the outcome of one request
+
+        Args:
+            success (bool): The request succeeded
+            elapsed (float): Latency of the request
+
+        Keyword Args:
+            reason (str): Issue of a failed request
+        """
+        with self._cond:
+            before = int(self._limit)
+            now = time.monotonic()
+
+            if success:
+                if self._baseline is None:
+                    self._baseline = elapsed
+                elif elapsed > self.latency_factor * self._baseline:
+                    success, reason = False, "latency"
+                else:
+                    self._baseline += 0.05 * (elapsed - self._baseline)
+
+            if success:
+                self._limit = min(self.maximum, self._limit + 1 / self._limit)
+            elif now - self._decreased_at >= (self._baseline or 0):
+                self._decreased_at = now
+                self._limit = max(self.minimum, self._limit * self.backoff)
+
+            after = int(self._limit)
+            if after > before:
+                self.increases += 1
+                reason = "increase"
+                self._cond.notify(after - before)
+            elif after < before:
+                self.decreases += 1
+            else:
+                return
+
+        if self.network is not None:
+            self.network.emit("concurrency", limit=after, reason=reason)
+
+    def stats(self):
+        """Get the limiter state
+
+        Returns:
+            dict: "limit", "in_flight", "increases", "decreases" and "baseline" (latency)
+        """
+        with self._cond:
+            return {"limit": int(self._limit),
+                    "in_flight": self._in_flight,
+                    "increases": self.increases,
+                    "decreases": self.decreases,
+                    "baseline": self._baseline}
+
+
+class _Unlimited:
+    """No-op limiter"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def run(self, fn, *args):
+        return fn(*args)
+
+
+def workers(concurrency):
+    """Get the thread count and limiter of a concurrency setting
+
+    Args:
+        concurrency (int or AdaptiveLimiter): Fixed concurrency or adaptive limiter
+
+    Returns:
+        tuple: (number of threads, limiter used as a context manager around each operation)
+    """
+    if isinstance(concurrency, AdaptiveLimiter):
+        return concurrency.maximum, concurrency
+    return concurrency, _Unlimited()
+
+
+def fan_out(atlas, groups, fetch, concurrency=Settings.concurrency):
+    """Walk the same listing on many groups concurrently
+
+    The walks run under the deadline of the thread consuming the results.
+
+    Args:
+        atlas (Atlas): Atlas instance (its network is shared by all groups)
+        groups (iterable of str): Group ids
+        fetch (function): Called with an Atlas instance per group, returns the walk
+                          (eg: lambda a: a.Clusters.get_all_clusters(iterable=True))
+
+    Keyword Args:
+        concurrency (int or AdaptiveLimiter): Number of pages fetched at once
+
+    Yields:
+        dict: One result, in arrival order
+
+    Raises:
+        Exception: The first issue of a walk
+    """
+    threads, limiter = workers(concurrency)
+    pages = queue.Queue(maxsize=threads * 2)
+    stop = threading.Event()
+    done = object()
+
+    def put(value):
+        while not stop.is_set():
+            try:
+                pages.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def walk(group):
+        try:
+            source = fetch(atlas.with_group(group))
+            if hasattr(source, "pages"):
+                # each page in a slot of the limiter, throttled pages are retried
+                for results in source.pages(limiter=limiter):
+                    if not put(results):
+                        return
+            else:
+                with limiter:
+                    results = list(source)
+                put(results)
+        except Exception as e:
+            put(e)
+        finally:
+            put(done)
+
+    groups = list(groups)
+    executor = ThreadPoolExecutor(max_workers=threads)
+    try:
+        # bound once iterated, under the deadline of the consumer
+        walk = bind(walk)
+        for group in groups:
+            executor.submit(walk, group)
+
+        remaining = len(groups)
+        while remaining:
+            value = pages.get()
+            if value is done:
+                remaining -= 1
+            elif isinstance(value, Exception):
+                raise value
+            else:
+                yield from value
+    finally:
+        stop.set()
+        executor.shutdown(wait=False)
+
+
+MapResult = namedtuple("MapResult", ["item", "value", "error"])
+MapResult.__doc__ = """Outcome of parallel_map for one item (error is None on success)"""
+
+
+class _End:
+    """End of the items of parallel_map"""
+
+    def __init__(self, count):
+        self.count = count
+
+
+def parallel_map(iterable, fn, concurrency=Settings.concurrency, ordered=False):
+    """Call a function on each item as soon as it is available
+
+    The iterable (eg: a pagination) is walked in a background thread, so pages are
+    fetched while the calls of the previous items run. At most twice the number of
+    threads items are in progress or waiting for the consumer.
+
+    Args:
+        iterable (iterable): Items (eg: a.Clusters.get_all_clusters(iterable=True))
+        fn (function): Called with each item (eg: a dependent API call)
+
+    Keyword Args:
+        concurrency (int or AdaptiveLimiter): Fixed concurrency or adaptive limiter
+        ordered (bool): Yield in the order of the items instead of the completion order
+
+    Yields:
+        MapResult: (item, value, error) per item, the error of a call does not stop the others
+
+    Raises:
+        Exception: Issue of the iterable (after the results of the items already read)
+    """
+    threads, limiter = workers(concurrency)
+    window = threading.Semaphore(threads * 2)
+    results = queue.Queue()
+    stop = threading.Event()
+    fn = bind(fn)
+
+    def call(item):
+        try:
+            return MapResult(item, limiter.run(fn, item), None)
+        except Exception as e:
+            return MapResult(item, None, e)
+
+    def feed():
+        count = 0
+        try:
+            for item in iterable:
+                while not window.acquire(timeout=0.1):
+                    if stop.is_set():
+                        return
+                if stop.is_set():
+                    return
+
+                future = executor.submit(call, item)
+                if ordered:
+                    results.put(future)
+                else:
+                    future.add_done_callback(results.put)
+                count += 1
+        except Exception as e:
+            results.put(e)
+        finally:
+            results.put(_End(count))
+
+    executor = ThreadPoolExecutor(max_workers=threads)
+    threading.Thread(target=bind(feed), name="atlasapi-parallel-map", daemon=True).start()
+
+    yielded = 0
+    total = None
+    error = None
+    try:
+        while total is None or yielded < total:
+            value = results.get()
+            if isinstance(value, _End):
+                total = value.count
+            elif isinstance(value, Exception):
+                error = value
+            else:
+                yielded += 1
+                window.release()
+                yield value.result()
+
+        if error is not None:
+            raise error
+    finally:
+        stop.set()
+        executor.shutdown(wait=False)
+
+
+async def parallel_map_async(iterable, fn, concurrency=Settings.concurrency, ordered=False):
+    """Call a function on each item as soon as it is available (asyncio)
+
+    Args:
+        iterable (iterable or async iterable): Items, a (sync) pagination is walked in a thread
+        fn (function or coroutine function): Called with each item, a function runs in a thread
+
+    Keyword Args:
+        concurrency (int or AdaptiveLimiter): Fixed concurrency or adaptive limiter
+        ordered (bool): Yield in the order of the items instead of the completion order
+
+    Yields:
+        MapResult: (item, value, error) per item, the error of a call does not stop the others
+
+    Raises:
+        Exception: Issue of the iterable (after the results of the items already read)
+    """
+    loop = asyncio.get_event_loop()
+    threads, limiter = workers(concurrency)
+    adaptive = isinstance(limiter, AdaptiveLimiter)
+    executor = ThreadPoolExecutor(max_workers=threads + 1)
+    window = asyncio.Semaphore(threads * 2)
+    running = asyncio.Semaphore(threads)
+    results = asyncio.Queue()
+    tasks = set()
+
+    async def acquire():
+        # The limiter blocks: wait for the slot in a thread
+        slot = loop.run_in_executor(executor, limiter.acquire)
+        try:
+            await asyncio.shield(slot)
+        except asyncio.CancelledError:
+            slot.add_done_callback(lambda future: limiter.release())
+            raise
+
+    async def attempt(item):
+        if not asyncio.iscoroutinefunction(fn):
+            return await loop.run_in_executor(executor, limiter.run, bind(fn), item)
+        if not adaptive:
+            return await fn(item)
+
+        # Same as AdaptiveLimiter.run for a coroutine
+        retries = 0
+        while True:
+            await acquire()
+            try:
+                return await fn(item)
+            except ErrAtlasGeneric as e:
+                if e.getAtlasResponse()[0] != Settings.TOO_MANY_REQUESTS or retries >= limiter.retries:
+                    raise
+            finally:
+                limiter.release()
+            retries += 1
+            await asyncio.sleep(limiter._baseline or 0)
+
+    async def call(item):
+        async with running:
+            try:
+                return MapResult(item, await attempt(item), None)
+            except Exception as e:
+                return MapResult(item, None, e)
+
+    async def items():
+        if hasattr(iterable, "__aiter__"):
+            async for item in iterable:
+                yield item
+        else:
+            iterator = iter(iterable)
+            end = object()
+            next_item = bind(lambda: next(iterator, end))
+            while True:
+                item = await loop.run_in_executor(executor, next_item)
+                if item is end:
+                    return
+                yield item
+
+    async def feed():
+        count = 0
+        try:
+            async for item in items():
+                await window.acquire()
+                task = asyncio.ensure_future(call(item))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                if ordered:
+                    results.put_nowait(task)
+                else:
+                    task.add_done_callback(results.put_nowait)
+                count += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            results.put_nowait(e)
+        finally:
+            results.put_nowait(_End(count))
+
+    feeder = asyncio.ensure_future(feed())
+
+    yielded = 0
+    total = None
+    error = None
+    try:
+        while total is None or yielded < total:
+            value = await results.get()
+            if isinstance(value, _End):
+                total = value.count
+            elif isinstance(value, Exception):
+                error = value
+            else:
+                yielded += 1
+                window.release()
+                yield await value
+
+        if error is not None:
+            raise error
+    finally:
+        # Stop the walk and the calls not consumed, a call running in a thread is only abandoned
+        feeder.cancel()
+        pending = list(tasks)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(feeder, *pending, return_exceptions=True)
+        executor.shutdown(wait=False)
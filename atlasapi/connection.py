@@ -0,0 +1,126 @@
+# Copyright (c) 2018 Yellow Pages Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Connection module
+
+Connection pool with a DNS cache
+"""
+
+import ipaddress
+import socket
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .settings import Settings
+
+
+class DNSCache:
+    """DNS cache with a TTL (thread safe)
+
+    Constructor
+
+    Keyword Args:
+        ttl (float): Seconds before resolving again a host
+    """
+
+    def __init__(self, ttl=Settings.dns_ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def resolve(self, host, port):
+        """Resolve a host
+
+        Args:
+            host (str): Host name
+            port (int): Port
+
+        Returns:
+            str: IP address
+        """
+        try:
+            ipaddress.ip_address(host)
+            return host
+        except ValueError:
+            pass
+
+        now = time.monotonic()
+        entry = self._entries.get((host, port))
+        if entry is not None and entry[1] > now:
+            return entry[0]
+
+        # Resolve outside of the lock, a concurrent resolution is harmless
+        address = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0][4][0]
+
+        with self._lock:
+            self._entries[(host, port)] = (address, now + self.ttl)
+
+        return address
+
+    def clear(self):
+        """Forget all entries"""
+        with self._lock:
+            self._entries.clear()
+
+
+class _CachedDNSConnection:
+    """Connection mixin connecting to the cached address
+
+    TLS (SNI and certificate) still uses the host name.
+    """
+
+    dns_cache = None
+
+    def _new_conn(self):
+        original = self._dns_host
+        self._dns_host = self.dns_cache.resolve(original, self.port)
+        try:
+            return super()._new_conn()
+        finally:
+            self._dns_host = original
+
+
+class AtlasAdapter(HTTPAdapter):
+    """HTTPAdapter using a DNS cache
+
+    Constructor
+
+    Keyword Args:
+        dns_cache (DNSCache): DNS cache (None to resolve on each new connection)
+        **kwargs: HTTPAdapter arguments (pool_connections, pool_maxsize, ...)
+    """
+
+    def __init__(self, dns_cache=None, **kwargs):
+        self.dns_cache = dns_cache
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+
+        if self.dns_cache is None:
+            return
+
+        attrs = {"dns_cache": self.dns_cache}
+        http = type("CachedDNSHTTPConnection", (_CachedDNSConnection, HTTPConnection), attrs)
+        https = type("CachedDNSHTTPSConnection", (_CachedDNSConnection, HTTPSConnection), attrs)
+
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": type("CachedDNSHTTPConnectionPool", (HTTPConnectionPool,), {"ConnectionCls": http}),
+            "https": type("CachedDNSHTTPSConnectionPool", (HTTPSConnectionPool,), {"ConnectionCls": https}),
+        }
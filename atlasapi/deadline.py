@@ -0,0 +1,113 @@
+# Copyright (c) 2018 Yellow Pages Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Deadline module
+
+Bound the total time of operations made of many requests.
+
+The current deadline is stored per thread and every Network request shrinks
+its timeouts to the remaining budget.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+class Deadline:
+    """Deadline constructor
+
+    Args:
+        seconds (float): Budget from now
+    """
+
+    def __init__(self, seconds):
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        """Remaining budget
+
+        Returns:
+            float: Seconds (negative when expired)
+        """
+        return self.expires - time.monotonic()
+
+
+def current():
+    """Get the deadline of the current thread
+
+    Returns:
+        Deadline: The deadline or None
+    """
+    return getattr(_local, "deadline", None)
+
+
+@contextmanager
+def use(deadline):
+    """Run a block under a deadline
+
+    Nested deadlines keep the earliest one.
+
+    Args:
+        deadline (Deadline): The deadline (None for no change)
+
+    Yields:
+        Deadline: The effective deadline
+    """
+    previous = current()
+
+    if deadline is not None and (previous is None or deadline.expires < previous.expires):
+        _local.deadline = deadline
+
+    try:
+        yield current()
+    finally:
+        _local.deadline = previous
+
+
+def within(seconds):
+    """Run a block with a budget of seconds
+
+    Args:
+        seconds (float): Budget from now (None for no change)
+
+    Returns:
+        contextmanager: see use()
+    """
+    return use(Deadline(seconds) if seconds is not None else None)
+
+
+def bind(fn):
+    """Bind the deadline of the current thread to a function
+
+    Used to propagate the deadline into worker threads.
+
+    Args:
+        fn (function): The function
+
+    Returns:
+        function: The function running under the current deadline
+    """
+    deadline = current()
+    if deadline is None:
+        return fn
+
+    def run(*args, **kwargs):
+        with use(deadline):
+            return fn(*args, **kwargs)
+
+    return run
@@ -206,3 +206,40 @@ class ErrConfirmationRequested(Exception):
 
     def __init__(self, msg):
         super().__init__(msg)
+
+
+class ErrWaitTimeout(Exception):
+    """Timeout reached while waiting for a state
+
+    Constructor
+
+    Args:
+        states (dict): Last known states
+    """
+
+    def __init__(self, states):
+        super().__init__("Timeout reached while waiting for a state (last known: %s)" % states)
+        self.states = states
+
+
+class ErrCircuitOpen(Exception):
+    """The circuit breaker of an endpoint is open
+
+    Constructor
+
+    Args:
+        endpoint (tuple): (resource group, operation)
+        retry_after (float): Seconds before the next try
+    """
+
+    def __init__(self, endpoint, retry_after):
+        super().__init__("Circuit open for [%s], retry in %.1fs" % (" / ".join(endpoint), retry_after))
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class ErrDeadlineExceeded(Exception):
+    """The deadline of the operation is exceeded"""
+
+    def __init__(self):
+        super().__init__("Deadline exceeded.")
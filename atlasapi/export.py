@@ -0,0 +1,200 @@
+# Copyright (c) 2018 Yellow Pages Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Export module
+
+Stream "Get All" results into newline-delimited JSON files.
+
+zstd compression needs the optional zstandard package.
+"""
+
+import gzip
+import json
+import os
+import queue
+import threading
+
+_END = object()
+
+
+class JsonLinesExporter:
+    """Newline-delimited JSON writer running in a background thread
+
+    Pages are handed to a writer thread which encodes, compresses and writes them
+    while the caller fetches the next pages. Memory is bounded by `queue_size` pages.
+
+    With `rotate_bytes`, a new file is started once the current one received this
+    amount of uncompressed bytes. Files are then named with an index before the
+    extensions (eg: users.jsonl.gz -> users-00001.jsonl.gz).
+
+    Constructor
+
+    Args:
+        path (str): Output file
+
+    Keyword Args:
+        compression (str): None, "gzip" or "zstd"
+        rotate_bytes (int): Uncompressed bytes per file (None for one file)
+        queue_size (int): Maximum number of pending pages
+    """
+
+    def __init__(self, path, compression=None, rotate_bytes=None, queue_size=16):
+        if compression not in (None, "gzip", "zstd"):
+            raise ValueError("Unsupported compression [%s]" % compression)
+
+        self.path = path
+        self.compression = compression
+        self.rotate_bytes = rotate_bytes
+        self.files = []
+        self.count = 0
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._file = None
+        self._written = 0
+        self._thread = threading.Thread(target=self._run, name="atlasapi-exporter", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def export(self, source):
+        """Write all results of a walk
+
+        Args:
+            source (AtlasPagination or iterable of dict): Results. AtlasPagination is consumed page by page.
+
+        Returns:
+            int: Number of results written by this call
+        """
+        written = 0
+
+        if hasattr(source, "pages"):
+            for results in source.pages():
+                self.write_many(results)
+                written += len(results)
+        else:
+            batch = []
+            for item in source:
+                batch.append(item)
+                if len(batch) >= 100:
+                    self.write_many(batch)
+                    written += len(batch)
+                    batch = []
+            if batch:
+                self.write_many(batch)
+                written += len(batch)
+
+        return written
+
+    def write_many(self, items):
+        """Queue results for writing
+
+        Args:
+            items (list of dict): Results
+        """
+        self._raise_error()
+        self._queue.put(items)
+
+    def write(self, item):
+        """Queue one result for writing
+
+        Args:
+            item (dict): Result
+        """
+        self.write_many([item])
+
+    def close(self):
+        """Flush and close the files
+
+        Raises:
+            Exception: Writer issue
+        """
+        if self._thread.is_alive():
+            self._queue.put(_END)
+            self._thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _run(self):
+        """Writer loop"""
+        try:
+            while True:
+                items = self._queue.get()
+                if items is _END:
+                    break
+
+                data = "".join(json.dumps(item, separators=(",", ":")) + "\n" for item in items).encode()
+
+                if self._file is None or (self.rotate_bytes and self._written >= self.rotate_bytes):
+                    self._open()
+
+                self._file.write(data)
+                self._written += len(data)
+                self.count += len(items)
+        except Exception as e:
+            self._error = e
+            # Unblock the producer
+            while self._queue.get() is not _END:
+                pass
+        finally:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _open(self):
+        """Open the next file"""
+        if self._file is not None:
+            self._file.close()
+
+        path = self.path
+        if self.rotate_bytes:
+            base, ext = _split_extensions(self.path)
+            path = "%s-%05d%s" % (base, len(self.files) + 1, ext)
+
+        if self.compression == "gzip":
+            self._file = gzip.open(path, "wb")
+        elif self.compression == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                raise ImportError("zstandard is required, please install atlasapi[zstd]")
+            self._file = zstandard.ZstdCompressor().stream_writer(open(path, "wb"), closefd=True)
+        else:
+            self._file = open(path, "wb")
+
+        self.files.append(path)
+        self._written = 0
+
+
+def _split_extensions(path):
+    """Split a path before its extensions
+
+    Args:
+        path (str): eg: /tmp/users.jsonl.gz
+
+    Returns:
+        str, str: eg: /tmp/users, .jsonl.gz
+    """
+    directory, name = os.path.split(path)
+    base, dot, ext = name.partition(".")
+    return os.path.join(directory, base), dot + ext
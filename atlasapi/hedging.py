@@ -0,0 +1,228 @@
+# Copyright (c) 2018 Yellow Pages Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Hedging module
+
+Duplicate slow GET requests to cut the latency tail
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from . import deadline
+from .settings import Settings
+
+
+class HedgingPolicy:
+    """Hedged requests policy (thread safe)
+
+    Requests run in the calling thread. When a request is still running after the
+    percentile of the recent latencies of its endpoint, a duplicate is sent from a
+    worker thread (on another pooled connection) and the first answer wins. The
+    other one is cancelled: its body is not read if it did not start yet.
+
+    Hedges are limited by a budget: each request earns budget hedge (eg: 0.05 for
+    at most 5% of extra requests).
+
+    Constructor
+
+    Keyword Args:
+        percentile (float): Latency percentile after which a request is hedged
+        budget (float): Maximum ratio of hedged requests
+        min_samples (int): Latencies needed for an endpoint before hedging its requests
+        window (int): Number of recent latencies kept per endpoint
+        workers (int): Threads running the requests
+    """
+
+    def __init__(self, percentile=Settings.hedging_percentile, budget=Settings.hedging_budget,
+                 min_samples=Settings.hedging_min_samples, window=Settings.hedging_window,
+                 workers=Settings.hedging_workers):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.window = window
+
+        self.requests = 0
+        self.hedges = 0
+        self.wins = 0
+
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._tokens = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="atlasapi-hedging")
+
+        # Hedges waiting for their delay: (due time, sequence, launch function)
+        self._timer = threading.Condition()
+        self._timers = []
+        self._sequence = itertools.count()
+        self._timer_thread = None
+
+    def delay(self, endpoint):
+        """Get the delay before hedging a request
+
+        Args:
+            endpoint (tuple): (resource group, operation)
+
+        Returns:
+            float: Seconds or None (not enough samples)
+        """
+        with self._lock:
+            latencies = self._latencies.get(endpoint)
+            if latencies is None or len(latencies) < self.min_samples:
+                return None
+            ordered = sorted(latencies)
+
+        return ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+
+    def record(self, endpoint, elapsed):
+        """Record the latency of a request (a lower bound for a cancelled one)
+
+        Args:
+            endpoint (tuple): (resource group, operation)
+            elapsed (float): Latency
+        """
+        with self._lock:
+            latencies = self._latencies.get(endpoint)
+            if latencies is None:
+                latencies = self._latencies[endpoint] = deque(maxlen=self.window)
+            latencies.append(elapsed)
+
+    def _spend(self):
+        """Take a hedge from the budget
+
+        Returns:
+            bool: A hedge is allowed
+        """
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            self.hedges += 1
+            return True
+
+    def _schedule(self, delay, fn):
+        """Call a function from the timer thread after a delay
+
+        Args:
+            delay (float): Seconds
+            fn (function): The function, called without arguments
+        """
+        with self._timer:
+            heapq.heappush(self._timers, (time.monotonic() + delay, next(self._sequence), fn))
+            if self._timer_thread is None:
+                self._timer_thread = threading.Thread(target=self._timer_loop, name="atlasapi-hedging-timer",
+                                                      daemon=True)
+                self._timer_thread.start()
+            self._timer.notify()
+
+    def _timer_loop(self):
+        """Call the scheduled functions when they are due"""
+        while True:
+            with self._timer:
+                while not self._timers or self._timers[0][0] > time.monotonic():
+                    self._timer.wait(self._timers[0][0] - time.monotonic() if self._timers else None)
+                fn = heapq.heappop(self._timers)[2]
+            fn()
+
+    def run(self, endpoint, attempt):
+        """Run a request, hedged if slow
+
+        The request runs in the calling thread, the hedge (if any) in a worker.
+
+        Args:
+            endpoint (tuple): (resource group, operation)
+            attempt (function): Send the request, called as attempt(cancel) where cancel
+                                is a threading.Event set when the other attempt won
+
+        Returns:
+            The first successful answer
+
+        Raises:
+            Exception: Issue of the first attempt (when all attempts failed)
+        """
+        with self._lock:
+            self.requests += 1
+            # A small cap avoids bursts of hedges after a quiet period
+            self._tokens = min(self._tokens + self.budget, 10)
+
+        def timed(cancel, other):
+            start = time.monotonic()
+            result = attempt(cancel)
+            # A cancelled attempt stopped early: its elapsed time is a lower bound of its latency,
+            # dropping it would bias the percentile towards the fast answers
+            self.record(endpoint, time.monotonic() - start)
+            if not cancel.is_set():
+                other.set()
+            return result
+
+        primary_cancel = threading.Event()
+        hedge_cancel = threading.Event()
+
+        delay = self.delay(endpoint)
+        if delay is None:
+            return timed(primary_cancel, hedge_cancel)
+
+        lock = threading.Lock()
+        state = {"done": False, "hedge": None}
+        # The hedge runs in a worker, with the deadline of the caller
+        hedged = deadline.bind(timed)
+
+        def launch():
+            with lock:
+                if state["done"] or not self._spend():
+                    return
+                state["hedge"] = self._executor.submit(hedged, hedge_cancel, primary_cancel)
+
+        self._schedule(delay, launch)
+
+        try:
+            result = timed(primary_cancel, hedge_cancel)
+        except Exception:
+            with lock:
+                state["done"] = True
+                hedge = state["hedge"]
+            if hedge is None or hedge.exception() is not None:
+                raise
+            result = hedge.result()
+        else:
+            with lock:
+                state["done"] = True
+                hedge = state["hedge"]
+            # The hedge answered first: the request stopped before reading its body
+            if hedge is None or not primary_cancel.is_set():
+                return result
+            result = hedge.result()
+
+        with self._lock:
+            self.wins += 1
+        return result
+
+    def stats(self):
+        """Get the hedging counters
+
+        Returns:
+            dict: "requests", "hedges", "wins" (hedge answered first) and "delays" (per endpoint)
+        """
+        with self._lock:
+            endpoints = list(self._latencies)
+            stats = {"requests": self.requests, "hedges": self.hedges, "wins": self.wins}
+
+        stats["delays"] = {endpoint: self.delay(endpoint) for endpoint in endpoints}
+        return stats
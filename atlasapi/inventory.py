@@ -0,0 +1,230 @@
+# Copyright (c) 2018 Yellow Pages Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Inventory module
+
+Persist "Get All" results into a local SQLite database
+"""
+
+import json
+import sqlite3
+import time
+
+from .atlas import AlertsGetAll, ClustersGetAll, DatabaseUsersGetAll, ProjectsGetAll, WhitelistGetAll
+from .changes import canonical, canonical_hash
+
+
+def content_hash(item, mask=()):
+    """Hash of an item content
+
+    Same hash as the change detector (see changes.canonical_hash).
+
+    Args:
+        item (dict): The item
+
+    Keyword Args:
+        mask (iterable of str): Dotted paths of volatile fields to ignore
+
+    Returns:
+        str: Hex digest
+    """
+    return canonical_hash(item, mask).hex()
+
+
+class InventoryStore:
+    """Inventory of Atlas resources stored in SQLite
+
+    Items are stored by kind ("clusters", "databaseUsers", "whitelist", "alerts", "projects"),
+    group and id, with indexes on group, name and state. A refresh only rewrites rows whose
+    content hash changed, volatile fields of the mask are ignored by the hash.
+
+    Constructor
+
+    Args:
+        path (str): SQLite database path (":memory:" for a transient store)
+
+    Keyword Args:
+        batch_size (int): Number of rows per bulk upsert
+        mask (iterable of str): Dotted paths of volatile fields to ignore (same as ChangeDetector)
+    """
+
+    # Pagination class -> (kind, id field(s), name field, state field)
+    kinds = {
+        ClustersGetAll: ("clusters", ("name",), "name", "stateName"),
+        DatabaseUsersGetAll: ("databaseUsers", ("username",), "username", None),
+        WhitelistGetAll: ("whitelist", ("cidrBlock", "ipAddress"), "comment", None),
+        AlertsGetAll: ("alerts", ("id",), "eventTypeName", "status"),
+        ProjectsGetAll: ("projects", ("id",), "name", None),
+    }
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS items (
+            kind TEXT NOT NULL,
+            group_id TEXT NOT NULL,
+            item_id TEXT NOT NULL,
+            name TEXT,
+            state TEXT,
+            hash TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (kind, group_id, item_id)
+        );
+        CREATE INDEX IF NOT EXISTS items_group ON items (group_id, kind);
+        CREATE INDEX IF NOT EXISTS items_name ON items (kind, name);
+        CREATE INDEX IF NOT EXISTS items_state ON items (kind, state);
+    """
+
+    def __init__(self, path, batch_size=500, mask=()):
+        self.path = path
+        self.batch_size = batch_size
+        self.mask = tuple(mask)
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(InventoryStore.schema)
+
+    def close(self):
+        """Close the database"""
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def refresh(self, pagination, prune=True):
+        """Refresh the store from a "Get All" walk
+
+        Everything is done in one transaction: an interrupted walk leaves the store untouched.
+
+        Args:
+            pagination (AtlasPagination): ClustersGetAll, DatabaseUsersGetAll, WhitelistGetAll, AlertsGetAll or
+                                          ProjectsGetAll
+
+        Keyword Args:
+            prune (bool): Delete stored items not returned by the walk. With a status filter on alerts,
+                          only the alerts stored with this status are pruned.
+
+        Returns:
+            dict: Number of items "inserted", "updated", "unchanged" and "deleted"
+        """
+        kind, id_fields, name_field, state_field = self.kinds[type(pagination)]
+        group = "" if kind == "projects" else pagination.atlas.group
+        status = getattr(pagination, "status", None)
+
+        stats = {"inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+
+        with self.connection:
+            query = "SELECT item_id, hash FROM items WHERE kind = ? AND group_id = ?"
+            args = [kind, group]
+            if status:
+                query += " AND state = ?"
+                args.append(status)
+            known = dict(self.connection.execute(query, args))
+
+            seen = set()
+            batch = []
+            now = time.time()
+
+            for item in pagination:
+                item_id = next(str(item[f]) for f in id_fields if item.get(f) is not None)
+                seen.add(item_id)
+
+                h = content_hash(item, self.mask)
+                previous = known.get(item_id)
+                if previous == h:
+                    stats["unchanged"] += 1
+                    continue
+
+                stats["inserted" if previous is None else "updated"] += 1
+                batch.append((kind, group, item_id,
+                              item.get(name_field),
+                              item.get(state_field) if state_field else None,
+                              h, canonical(item).decode(), now))
+
+                if len(batch) >= self.batch_size:
+                    self._upsert(batch)
+                    batch = []
+
+            if batch:
+                self._upsert(batch)
+
+            if prune:
+                removed = [(kind, group, item_id) for item_id in known if item_id not in seen]
+                self.connection.executemany(
+                    "DELETE FROM items WHERE kind = ? AND group_id = ? AND item_id = ?", removed)
+                stats["deleted"] = len(removed)
+
+        return stats
+
+    def _upsert(self, rows):
+        """Bulk upsert
+
+        Args:
+            rows (list of tuple): Rows
+        """
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO items (kind, group_id, item_id, name, state, hash, payload, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def query(self, kind, group=None, name=None, state=None):
+        """Query stored items
+
+        Args:
+            kind (str): Kind of items
+
+        Keyword Args:
+            group (str): Filter on group
+            name (str): Filter on name
+            state (str): Filter on state
+
+        Yields:
+            dict: One item
+        """
+        where, args = self._where(kind, group, name, state)
+        for (payload,) in self.connection.execute("SELECT payload FROM items WHERE " + where, args):
+            yield json.loads(payload)
+
+    def count(self, kind, group=None, name=None, state=None):
+        """Count stored items
+
+        Args:
+            kind (str): Kind of items
+
+        Keyword Args:
+            group (str): Filter on group
+            name (str): Filter on name
+            state (str): Filter on state
+
+        Returns:
+            int: Number of items
+        """
+        where, args = self._where(kind, group, name, state)
+        return self.connection.execute("SELECT COUNT(*) FROM items WHERE " + where, args).fetchone()[0]
+
+    def _where(self, kind, group, name, state):
+        """Build a WHERE clause
+
+        Returns:
+            str, list: Clause and arguments
+        """
+        clauses = ["kind = ?"]
+        args = [kind]
+
+        for column, value in (("group_id", group), ("name", name), ("state", state)):
+            if value is not None:
+                clauses.append("%s = ?" % column)
+                args.append(value)
+
+        return " AND ".join(clauses), args
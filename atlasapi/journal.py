@@ -0,0 +1,185 @@
+# Copyright (c) 2018 Yellow Pages Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Journal module
+
+Append-only journal of mutations to resume interrupted batches
+"""
+
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+from .settings import Settings
+
+
+class Journal:
+    """Write-ahead journal of mutations
+
+    Each mutation appends an "intent" record before the request and a "done" or "failed"
+    record after it. With resume, operations already done in a previous run are not sent
+    again: their recorded response is returned instead.
+
+    An operation is identified by its key (name, group, target and payload digest, see
+    Atlas.journaled) and its occurrence: the second run of a key in a batch only matches
+    the second run of this key in previous runs (eg: delete, create, delete of one user).
+
+    Records are fsynced in batches (every `fsync_every` records or `fsync_interval` seconds).
+    After a crash, the last outcomes may be lost and these operations are sent again on resume.
+
+    A journal file is meant for one batch.
+
+    Constructor
+
+    Args:
+        path (str): Journal file
+
+    Keyword Args:
+        resume (bool): Skip operations already done in the existing file
+        fsync_every (int): Number of records between 2 fsync
+        fsync_interval (float): Maximum seconds between 2 fsync
+    """
+
+    INTENT = "intent"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, path, resume=True, fsync_every=Settings.journal_fsync_every,
+                 fsync_interval=Settings.journal_fsync_interval):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+
+        # (key, occurrence) -> result, from previous runs only
+        self.replayed = {}
+        self.pending = set()
+        self._occurrences = Counter()
+        self._running = {}
+        if resume and os.path.exists(path):
+            self._replay()
+
+        self._lock = threading.Lock()
+        self._file = open(path, "a")
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _replay(self):
+        """Load the outcome of previous runs"""
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # torn write at crash time
+                    continue
+
+                key = (record["key"], record.get("seq", 0))
+                if record["state"] == Journal.DONE:
+                    self.replayed[key] = record.get("result")
+                    self.pending.discard(key)
+                elif record["state"] == Journal.INTENT:
+                    self.pending.add(key)
+                else:
+                    self.pending.discard(key)
+
+    def run(self, key, fn):
+        """Run an operation through the journal
+
+        Thread-safe: concurrent runs of the same key are serialized, so the
+        operation is not applied twice at the same time. Each run is sent, unless
+        its occurrence was done in a previous run.
+
+        Args:
+            key (str): Operation identity
+            fn (function): The operation
+
+        Returns:
+            The operation result (or the recorded one if done in a previous run)
+        """
+        with self._lock:
+            seq = self._occurrences[key]
+            self._occurrences[key] += 1
+
+            if (key, seq) in self.replayed:
+                return self.replayed[(key, seq)]
+
+        while True:
+            with self._lock:
+                running = self._running.get(key)
+                if running is None:
+                    running = self._running[key] = threading.Event()
+                    break
+
+            # Same operation in progress in another thread, wait for its end
+            running.wait()
+
+        try:
+            self._append({"key": key, "seq": seq, "state": Journal.INTENT})
+            try:
+                result = fn()
+            except Exception as e:
+                self._append({"key": key, "seq": seq, "state": Journal.FAILED,
+                              "error": "%s: %s" % (type(e).__name__, e)})
+                raise
+
+            self._append({"key": key, "seq": seq, "state": Journal.DONE, "result": result})
+            return result
+        finally:
+            with self._lock:
+                del self._running[key]
+            running.set()
+
+    def _append(self, record):
+        """Append a record
+
+        Args:
+            record (dict): Record
+        """
+        line = json.dumps(record, separators=(",", ":"), default=str) + "\n"
+
+        with self._lock:
+            self._file.write(line)
+            self._unsynced += 1
+
+            if self._unsynced >= self.fsync_every or time.monotonic() - self._synced_at >= self.fsync_interval:
+                self._sync()
+
+    def _sync(self):
+        """Flush and fsync (lock held)"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    def flush(self):
+        """Flush and fsync pending records"""
+        with self._lock:
+            if self._unsynced:
+                self._sync()
+
+    def close(self):
+        """Flush and close the journal"""
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
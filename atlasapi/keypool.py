@@ -0,0 +1,145 @@
+# Copyright (c) 2018 Yellow Pages Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Key pool module
+
+Distribute requests over several API keys with the same project access
+"""
+
+import itertools
+import threading
+import time
+
+from .auth import DigestAuth
+from .connection import AtlasAdapter
+from .settings import Settings
+
+
+class ApiKey:
+    """One API key of a KeyPool
+
+    Each key has its own digest state and connection pool.
+
+    Constructor
+
+    Args:
+        user (str): user
+        password (str): password
+        adapter (AtlasAdapter): Connection pool of the key
+    """
+
+    def __init__(self, user, password, adapter):
+        self.user = user
+        self.auth = DigestAuth(user, password)
+        self.adapter = adapter
+
+        self.in_flight = 0
+        self.requests = 0
+        self.throttled = 0
+        self.busy = 0.0
+        self.cooldown_until = 0.0
+
+
+class KeyPool:
+    """Pool of API keys (thread safe)
+
+    Each request goes to the least loaded key (fewest requests in flight, ties are
+    broken round robin). A key answering 429 is set aside for the cooldown period
+    unless all keys are cooling down.
+
+    Constructor
+
+    Args:
+        credentials (list): (user, password) of each key
+
+    Keyword Args:
+        dns_cache (DNSCache): DNS cache shared by the connection pools
+        pool_maxsize (int): Connections kept in the pool of each key
+        cooldown (float): Seconds a throttled key is set aside
+    """
+
+    def __init__(self, credentials, dns_cache=None, pool_maxsize=Settings.pool_maxsize,
+                 cooldown=Settings.key_cooldown):
+        if not credentials:
+            raise ValueError("At least one API key is required")
+
+        self.keys = [ApiKey(user, password, AtlasAdapter(dns_cache, pool_maxsize=pool_maxsize))
+                     for user, password in credentials]
+        self.cooldown = cooldown
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._turn = itertools.count()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def acquire(self, exclude=()):
+        """Select the key of the next request
+
+        Keyword Args:
+            exclude (iterable): Keys to avoid (already throttled for this request)
+
+        Returns:
+            ApiKey: The key, to give back with release()
+        """
+        with self._lock:
+            now = time.monotonic()
+            candidates = [key for key in self.keys if key not in exclude] or self.keys
+            ready = [key for key in candidates if key.cooldown_until <= now]
+            if ready:
+                turn = next(self._turn)
+                count = len(ready)
+                key = min(enumerate(ready), key=lambda item: (item[1].in_flight, (item[0] - turn) % count))[1]
+            else:
+                key = min(candidates, key=lambda k: k.cooldown_until)
+
+            key.in_flight += 1
+            key.requests += 1
+            return key
+
+    def release(self, key, elapsed, throttled=False):
+        """Give back a key
+
+        Args:
+            key (ApiKey): Key returned by acquire()
+            elapsed (float): Duration of the request
+
+        Keyword Args:
+            throttled (bool): The request was rejected with 429
+        """
+        with self._lock:
+            key.in_flight -= 1
+            key.busy += elapsed
+            if throttled:
+                key.throttled += 1
+                key.cooldown_until = time.monotonic() + self.cooldown
+
+    def utilization(self):
+        """Get the utilization of each key
+
+        Returns:
+            dict: user -> dict with "requests", "in_flight", "throttled", "cooling_down" and
+                  "utilization" (busy time / pool lifetime, above 1 with concurrent requests)
+        """
+        with self._lock:
+            now = time.monotonic()
+            lifetime = max(now - self.started, 1e-9)
+            return {key.user: {"requests": key.requests,
+                               "in_flight": key.in_flight,
+                               "throttled": key.throttled,
+                               "cooling_down": key.cooldown_until > now,
+                               "utilization": key.busy / lifetime}
+                    for key in self.keys}
@@ -18,8 +18,18 @@ Network module
 Permit to communicate with external APIs
 """
 
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
 import requests
-from requests.auth import HTTPDigestAuth
+import urllib3
+from . import compression, deadline
+from .auth import DigestAuth
+from .connection import AtlasAdapter, DNSCache
+from .keypool import KeyPool
 from .settings import Settings
 from .errors import *
 
@@ -30,11 +40,178 @@ class Network:
     Args:
         user (str): user
         password (str): password
+
+    Keyword Args:
+        circuit_breaker (CircuitBreakers): Fail fast on unhealthy endpoints (None to disable)
+        timeout (float or tuple): Request timeout or (connect, read) timeouts.
+                                  Default to Settings.requests_connect_timeout and Settings.requests_timeout
+        pool_maxsize (int): Connections kept in the pool (default to Settings.pool_maxsize).
+                            Use the number of threads sharing the instance.
+        keys (list): (user, password) of additional API keys with the same access.
+                     Requests are then distributed over all keys (see KeyPool).
+        hedging (HedgingPolicy): Duplicate slow GET requests (None to disable)
+        cache (ResponseCache): Persistent cache of GET responses (None to disable)
+        transport (Transport): Send the requests with this transport instead of HTTP (eg: FakeAtlas)
+
+    A Network is thread-safe: each thread gets its own requests.Session while the
+    connection pool, DNS cache, digest nonce, circuit breakers and transfer
+    statistics are shared and protected by locks.
     """
 
-    def __init__(self, user, password):
+    def __init__(self, user, password, circuit_breaker=None, timeout=None, pool_maxsize=None, keys=None,
+                 hedging=None, cache=None, transport=None):
         self.user = user
         self.password = password
+        self.circuit_breaker = circuit_breaker
+        self.timeout = timeout
+        self.hedging = hedging
+        self.cache = cache
+        self.transport = transport
+        self.cache_identity = cache.identity(user, password) if cache is not None else None
+        self.hooks = ()
+        self.transfer = compression.TransferStats()
+
+        # Pooled connections and digest nonce are reused between requests
+        self.auth = DigestAuth(user, password)
+        self.dns_cache = DNSCache()
+        self.adapter = AtlasAdapter(self.dns_cache, pool_maxsize=pool_maxsize or Settings.pool_maxsize)
+        self._hooks_lock = threading.Lock()
+        self._local = threading.local()
+
+        self.key_pool = None
+        if keys:
+            self.key_pool = KeyPool([(user, password)] + list(keys), self.dns_cache,
+                                    pool_maxsize or Settings.pool_maxsize)
+
+    @property
+    def session(self):
+        """requests.Session of the current thread
+
+        A Session is not thread-safe, but all of them share the same adapter (connection pool).
+
+        Returns:
+            Session: Session
+        """
+        return self._session(self.adapter)
+
+    def _session(self, adapter):
+        """Get the Session of the current thread for a connection pool
+
+        Args:
+            adapter (AtlasAdapter): Connection pool
+
+        Returns:
+            Session: Session
+        """
+        sessions = getattr(self._local, "sessions", None)
+        if sessions is None:
+            sessions = self._local.sessions = {}
+
+        session = sessions.get(id(adapter))
+        if session is None:
+            session = sessions[id(adapter)] = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        return session
+
+    def prewarm(self, connections=Settings.prewarm_connections, background=False):
+        """Prepare the network before the first real request
+
+        Resolve and cache Settings.BASE_URL address, open pooled connections
+        (TCP + TLS) and get a digest nonce.
+
+        Keyword Args:
+            connections (int): Number of connections to open
+            background (bool): Return immediately and prewarm in a background thread
+
+        Returns:
+            Thread or None: The background thread
+        """
+        if self.transport is not None:
+            # Nothing to prepare
+            return None
+
+        if background:
+            thread = threading.Thread(target=self.prewarm, args=(connections,),
+                                      name="atlasapi-prewarm", daemon=True)
+            thread.start()
+            return thread
+
+        url = urlsplit(Settings.BASE_URL)
+        self.dns_cache.resolve(url.hostname, url.port or (443 if url.scheme == "https" else 80))
+
+        uri = Settings.BASE_URL + Settings.api_resources["Root"]["Get Root"]
+
+        def warm():
+            try:
+                self.get(uri, endpoint=("Root", "Get Root"))
+            except Exception:
+                # Prewarm is best effort
+                pass
+
+        # The first request gets the nonce, the next ones open the other connections concurrently
+        warm()
+        if connections > 1:
+            with ThreadPoolExecutor(max_workers=connections - 1) as executor:
+                for _ in range(connections - 1):
+                    executor.submit(warm)
+
+    def timeouts(self):
+        """Get the (connect, read) timeouts of the next request
+
+        Both are shrunk to the remaining budget of the current deadline.
+
+        Returns:
+            tuple: (connect, read) timeouts
+
+        Raises:
+            ErrDeadlineExceeded: No remaining budget
+        """
+        if self.timeout is None:
+            timeout = (Settings.requests_connect_timeout, Settings.requests_timeout)
+        elif isinstance(self.timeout, tuple):
+            timeout = self.timeout
+        else:
+            timeout = (self.timeout, self.timeout)
+
+        current = deadline.current()
+        if current is not None:
+            remaining = current.remaining()
+            if remaining <= 0:
+                raise ErrDeadlineExceeded()
+            timeout = (min(timeout[0], remaining), min(timeout[1], remaining))
+
+        return timeout
+
+    def add_hook(self, hook):
+        """Add an instrumentation hook
+
+        The hook is called as hook(event, data) with:
+
+        - "request": data contains endpoint, method, uri, status (None on network issue), elapsed, error,
+          wire_bytes and body_bytes (response sizes before and after decompression) and user (API key)
+        - "circuit": data contains endpoint and state
+        - "cache": data contains endpoint and uri of a response served by the cache
+
+        Args:
+            hook (function): The hook (called from any thread issuing requests)
+        """
+        # Copy on write, emit() iterates without lock
+        with self._hooks_lock:
+            self.hooks = self.hooks + (hook,)
+
+    def emit(self, event, **data):
+        """Call all instrumentation hooks
+
+        Args:
+            event (str): Event name
+            **data: Event details
+        """
+        for hook in self.hooks:
+            hook(event, data)
+
+    def _on_circuit_state(self, endpoint, state):
+        self.emit("circuit", endpoint=endpoint, state=state)
 
     def answer(self, c, details):
         """Answer will provide all necessary feedback for the caller
@@ -74,114 +251,276 @@ class Network:
             # Settings.SERVER_ERRORS
             raise ErrAtlasServerErrors(c, details)
 
-    def get(self, uri):
-        """Get request
+    def request(self, method, uri, payload=None, endpoint=None, cache=True):
+        """Generic request
 
         Args:
+            method (str): HTTP method
             uri (str): URI
 
+        Keyword Args:
+            payload (dict): Content to send
+            endpoint (tuple): (resource group, operation) from Settings.api_resources
+            cache (bool): Read the response cache for a GET (False for a fresh response, which is still cached)
+
         Returns:
             Json: API response
 
         Raises:
             Exception: Network issue
+            ErrCircuitOpen: The circuit breaker of the endpoint is open
+            ErrDeadlineExceeded: The deadline of the operation is exceeded
+        """
+        if self.cache is None:
+            return self._hedged(method, uri, payload, endpoint)
+
+        if method == "GET":
+            details = self.cache.get(self.cache_identity, uri) if cache else None
+            if details is not None:
+                if self.hooks:
+                    self.emit("cache", endpoint=endpoint, uri=uri)
+                return details
+
+            details = self._hedged(method, uri, payload, endpoint)
+            self.cache.put(self.cache_identity, uri, details, endpoint)
+            return details
+
+        # Drop the responses the mutation may change, again once it is applied
+        # as a concurrent GET may have cached the previous state meanwhile
+        self.cache.invalidate(uri)
+        try:
+            return self._hedged(method, uri, payload, endpoint)
+        finally:
+            self.cache.invalidate(uri)
+
+    def _hedged(self, method, uri, payload, endpoint):
+        """Send a request, hedged if enabled
+
+        Args:
+            method (str): HTTP method
+            uri (str): URI
+            payload (dict): Content to send (or None)
+            endpoint (tuple): (resource group, operation) or None
+
+        Returns:
+            Json: API response
         """
+        if self.hedging is not None and method == "GET" and endpoint is not None:
+            return self.hedging.run(endpoint, lambda cancel: self._request(method, uri, payload, endpoint, cancel))
+
+        return self._request(method, uri, payload, endpoint)
+
+    def _request(self, method, uri, payload, endpoint, cancel=None):
+        """Send a request with the main key or the key pool
+
+        Args:
+            method (str): HTTP method
+            uri (str): URI
+            payload (dict): Content to send (or None)
+            endpoint (tuple): (resource group, operation) or None
+
+        Keyword Args:
+            cancel (Event): Set when the answer is not needed anymore (hedged request)
+
+        Returns:
+            Json: API response (None when cancelled)
+        """
+        if self.key_pool is None:
+            return self._send(method, uri, payload, endpoint, self.auth, self.session, cancel)
+
+        # Throttled requests are retried once on each other key
+        throttled = []
+        while True:
+            key = self.key_pool.acquire(throttled)
+            start = time.monotonic()
+            status = None
+            try:
+                return self._send(method, uri, payload, endpoint, key.auth, self._session(key.adapter), cancel)
+            except ErrAtlasGeneric as e:
+                status = e.getAtlasResponse()[0]
+                if status != Settings.TOO_MANY_REQUESTS or len(throttled) + 1 >= len(self.key_pool):
+                    raise
+                throttled.append(key)
+            finally:
+                self.key_pool.release(key, time.monotonic() - start, status == Settings.TOO_MANY_REQUESTS)
+
+    def _send(self, method, uri, payload, endpoint, auth, session, cancel=None):
+        """Send one request
+
+        Args:
+            method (str): HTTP method
+            uri (str): URI
+            payload (dict): Content to send (or None)
+            endpoint (tuple): (resource group, operation) or None
+            auth (DigestAuth): Credentials
+            session (Session): Session
+
+        Keyword Args:
+            cancel (Event): Set when the answer is not needed anymore (the body is not read)
+
+        Returns:
+            Json: API response (None when cancelled)
+        """
+        timeout = self.timeouts()
+
+        breaker = None
+        if self.circuit_breaker is not None and endpoint is not None:
+            breaker = self.circuit_breaker.get(endpoint, self._on_circuit_state)
+            breaker.before()
+
         r = None
+        status = None
+        error = None
+        wire_bytes = body_bytes = 0
+        start = time.monotonic()
 
         try:
-            r = requests.get(uri,
-                             allow_redirects=True,
-                             timeout=Settings.requests_timeout,
-                             headers={},
-                             auth=HTTPDigestAuth(self.user, self.password))
-            return self.answer(r.status_code, r.json())
-        except:
+            if self.transport is not None:
+                status, details = self.transport.request(method, uri, payload, timeout)
+                return self.answer(status, details)
+
+            if payload is None:
+                r = session.request(method, uri,
+                                    allow_redirects=True,
+                                    timeout=timeout,
+                                    headers={"Accept-Encoding": compression.accept_encoding()},
+                                    auth=auth,
+                                    stream=True)
+            else:
+                r = session.request(method, uri,
+                                    json=payload,
+                                    allow_redirects=True,
+                                    timeout=timeout,
+                                    headers={"Content-Type": "application/json",
+                                             "Accept-Encoding": compression.accept_encoding()},
+                                    auth=auth,
+                                    stream=True)
+
+            status = r.status_code
+            if cancel is not None and cancel.is_set():
+                return None
+
+            raw = self._read_raw(r)
+            body = compression.decode(raw, r.headers.get("Content-Encoding"))
+            wire_bytes, body_bytes = len(raw), len(body)
+            self.transfer.record(endpoint, wire_bytes, body_bytes)
+
+            return self.answer(status, json.loads(body.decode("utf-8")))
+        except requests.Timeout as e:
+            error = e
+            current = deadline.current()
+            if current is not None and current.remaining() <= 0:
+                error = ErrDeadlineExceeded()
+                raise error from e
+            raise
+        except Exception as e:
+            error = e
             raise
         finally:
-            if r:
-                r.connection.close()
+            if breaker:
+                if isinstance(error, ErrDeadlineExceeded):
+                    # Our own budget, not an endpoint failure
+                    breaker.record(None)
+                else:
+                    breaker.record(status is not None and status < Settings.SERVER_ERRORS
+                                   and status != Settings.TOO_MANY_REQUESTS)
+
+            if self.hooks:
+                self.emit("request", endpoint=endpoint, method=method, uri=uri, status=status,
+                          elapsed=time.monotonic() - start, error=error,
+                          wire_bytes=wire_bytes, body_bytes=body_bytes, user=auth.username)
+
+            if r is not None:
+                # Give the connection back to the pool
+                r.close()
+
+    def _read_raw(self, r):
+        """Read a streamed body as received (still compressed) to account the wire size
+
+        Args:
+            r (Response): Streamed response
+
+        Returns:
+            bytes: Body
+
+        Raises:
+            requests.ReadTimeout: Read timeout
+            requests.ConnectionError: Connection issue
+        """
+        try:
+            return r.raw.read(decode_content=False)
+        except urllib3.exceptions.ReadTimeoutError as e:
+            raise requests.ReadTimeout(e, request=r.request)
+        except (urllib3.exceptions.ProtocolError, urllib3.exceptions.SSLError) as e:
+            raise requests.ConnectionError(e, request=r.request)
+
+    def get(self, uri, endpoint=None, cache=True):
+        """Get request
 
-    def post(self, uri, payload):
+        Args:
+            uri (str): URI
+
+        Keyword Args:
+            endpoint (tuple): (resource group, operation) from Settings.api_resources
+            cache (bool): Read the response cache (False for a fresh response, which is still cached)
+
+        Returns:
+            Json: API response
+
+        Raises:
+            Exception: Network issue
+        """
+        return self.request("GET", uri, endpoint=endpoint, cache=cache)
+
+    def post(self, uri, payload, endpoint=None):
         """Post request
 
         Args:
             uri (str): URI
             payload (dict): Content to post 
 
+        Keyword Args:
+            endpoint (tuple): (resource group, operation) from Settings.api_resources
+
         Returns:
             Json: API response
 
         Raises:
             Exception: Network issue
         """
-        r = None
+        return self.request("POST", uri, payload, endpoint)
 
-        try:
-            r = requests.post(uri,
-                              json=payload,
-                              allow_redirects=True,
-                              timeout=Settings.requests_timeout,
-                              headers={"Content-Type": "application/json"},
-                              auth=HTTPDigestAuth(self.user, self.password))
-            return self.answer(r.status_code, r.json())
-        except:
-            raise
-        finally:
-            if r:
-                r.connection.close()
-
-    def patch(self, uri, payload):
+    def patch(self, uri, payload, endpoint=None):
         """Patch request
 
         Args:
             uri (str): URI
             payload (dict): Content to patch
 
+        Keyword Args:
+            endpoint (tuple): (resource group, operation) from Settings.api_resources
+
         Returns:
             Json: API response
 
         Raises:
             Exception: Network issue
         """
-        r = None
-
-        try:
-            r = requests.patch(uri,
-                               json=payload,
-                               allow_redirects=True,
-                               timeout=Settings.requests_timeout,
-                               headers={"Content-Type": "application/json"},
-                               auth=HTTPDigestAuth(self.user, self.password))
-            return self.answer(r.status_code, r.json())
-        except:
-            raise
-        finally:
-            if r:
-                r.connection.close()
+        return self.request("PATCH", uri, payload, endpoint)
 
-    def delete(self, uri):
+    def delete(self, uri, endpoint=None):
         """Delete request
 
         Args:
             uri (str): URI
 
+        Keyword Args:
+            endpoint (tuple): (resource group, operation) from Settings.api_resources
+
         Returns:
             Json: API response
 
         Raises:
             Exception: Network issue
         """
-        r = None
-
-        try:
-            r = requests.delete(uri,
-                                allow_redirects=True,
-                                timeout=Settings.requests_timeout,
-                                headers={},
-                                auth=HTTPDigestAuth(self.user, self.password))
-            return self.answer(r.status_code, r.json())
-        except:
-            raise
-        finally:
-            if r:
-                r.connection.close()
+        return self.request("DELETE", uri, endpoint=endpoint)
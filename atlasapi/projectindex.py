@@ -0,0 +1,288 @@
+# Copyright (c) 2018 Yellow Pages Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Project index module
+
+Resolve projects by name without walking all the projects each time
+"""
+
+import json
+import os
+import threading
+import time
+
+from .settings import Settings
+
+
+class ProjectIndex:
+    """In-memory index of the projects (thread safe)
+
+    Keeps name -> project, id -> project and orgId -> project ids maps built from
+    Projects.get_all_projects. After ttl seconds, the next lookup walks the projects
+    again and swaps in the new maps; the other lookups meanwhile keep using the
+    previous ones. A name or id missing from a fresh
+    index is fetched alone (Get One Project by Name / Get One Project).
+
+    With a path, the index is saved after each walk and loaded by the next processes
+    while it is fresh.
+
+    Constructor
+
+    Args:
+        atlas (Atlas): Atlas instance (its group is not used)
+
+    Keyword Args:
+        ttl (float): Seconds before walking the projects again
+        path (str): JSON file to persist the index (None to keep it in memory only)
+    """
+
+    def __init__(self, atlas, ttl=Settings.project_index_ttl, path=None):
+        self.atlas = atlas
+        self.ttl = ttl
+        self.path = path
+
+        self._lock = threading.RLock()
+        self._walk = threading.Lock()
+        self._by_id = {}
+        self._by_name = {}
+        self._by_org = {}
+        # Wall clock, shared with the other processes through the file
+        self._refreshed = None
+
+        if path is not None and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        """Load the persisted index"""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except ValueError:
+            # corrupted file, walk again
+            return
+
+        self._apply(data["projects"])
+        self._refreshed = data["refreshed"]
+
+    def _save(self):
+        """Persist the index (lock held)"""
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"refreshed": self._refreshed, "projects": list(self._by_id.values())}, f)
+        os.replace(tmp, self.path)
+
+    def _add(self, project):
+        """Index one project (lock held)
+
+        Args:
+            project (dict): Project
+        """
+        self._remove(project["id"])
+        self._by_id[project["id"]] = project
+        self._by_name[project["name"]] = project
+        self._by_org.setdefault(project.get("orgId"), set()).add(project["id"])
+
+    def _remove(self, groupid):
+        """Forget one project (lock held)
+
+        Args:
+            groupid (str): Project id
+        """
+        project = self._by_id.pop(groupid, None)
+        if project is None:
+            return
+
+        if self._by_name.get(project["name"]) is project:
+            del self._by_name[project["name"]]
+
+        ids = self._by_org.get(project.get("orgId"))
+        if ids is not None:
+            ids.discard(groupid)
+            if not ids:
+                del self._by_org[project.get("orgId")]
+
+    def _apply(self, projects):
+        """Replace the maps by the ones of a full list of projects
+
+        The new maps are built without the lock, then swapped in.
+
+        Args:
+            projects (list of dict): Projects
+
+        Returns:
+            dict: "added", "removed" and "changed" project ids
+        """
+        with self._lock:
+            previous = self._by_id
+
+        by_id = {}
+        by_name = {}
+        by_org = {}
+        changes = {"added": [], "removed": [], "changed": []}
+
+        for project in projects:
+            old = previous.get(project["id"])
+            if old is None:
+                changes["added"].append(project["id"])
+            elif old.get("name") != project["name"] or old.get("orgId") != project.get("orgId"):
+                changes["changed"].append(project["id"])
+            by_id[project["id"]] = project
+            by_name[project["name"]] = project
+            by_org.setdefault(project.get("orgId"), set()).add(project["id"])
+
+        changes["removed"] = [groupid for groupid in previous if groupid not in by_id]
+
+        with self._lock:
+            self._by_id = by_id
+            self._by_name = by_name
+            self._by_org = by_org
+
+        return changes
+
+    def is_fresh(self):
+        """Check if the index is within its TTL
+
+        Returns:
+            bool: Fresh
+        """
+        return self._refreshed is not None and time.time() - self._refreshed < self.ttl
+
+    def refresh(self, force=False):
+        """Walk the projects if the index is stale
+
+        Keyword Args:
+            force (bool): Walk even if fresh
+
+        Returns:
+            dict: "added", "removed" and "changed" project ids (None if still fresh)
+        """
+        if not force and self.is_fresh():
+            return None
+
+        # One walk at a time; lookups keep using the current maps meanwhile (once there are some)
+        if not self._walk.acquire(blocking=force or self._refreshed is None):
+            return None
+
+        try:
+            if not force and self.is_fresh():
+                # Walked by another thread meanwhile
+                return None
+
+            projects = []
+            listing = self.atlas.Projects.get_all_projects(itemsPerPage=Settings.itemsPerPageMax, iterable=True)
+            for results in listing.pages(Settings.concurrency):
+                projects.extend(results)
+
+            changes = self._apply(projects)
+            with self._lock:
+                self._refreshed = time.time()
+                if self.path is not None:
+                    self._save()
+
+            return changes
+        finally:
+            self._walk.release()
+
+    def get(self, name):
+        """Get a project by name
+
+        Args:
+            name (str): Project name
+
+        Returns:
+            dict: Project
+
+        Raises:
+            ErrAtlasNotFound: No project with this name
+        """
+        self.refresh()
+
+        with self._lock:
+            project = self._by_name.get(name)
+        if project is not None:
+            return project
+
+        # Created since the last walk
+        project = self.atlas.Projects.get_one_project_by_name(name)
+        with self._lock:
+            self._add(project)
+        return project
+
+    def get_by_id(self, groupid):
+        """Get a project by id
+
+        Args:
+            groupid (str): Project id
+
+        Returns:
+            dict: Project
+
+        Raises:
+            ErrAtlasNotFound: No project with this id
+        """
+        self.refresh()
+
+        with self._lock:
+            project = self._by_id.get(groupid)
+        if project is not None:
+            return project
+
+        project = self.atlas.Projects.get_one_project(groupid)
+        with self._lock:
+            self._add(project)
+        return project
+
+    def id_of(self, name):
+        """Get the id of a project
+
+        Args:
+            name (str): Project name
+
+        Returns:
+            str: Project id
+
+        Raises:
+            ErrAtlasNotFound: No project with this name
+        """
+        return self.get(name)["id"]
+
+    def name_of(self, groupid):
+        """Get the name of a project
+
+        Args:
+            groupid (str): Project id
+
+        Returns:
+            str: Project name
+
+        Raises:
+            ErrAtlasNotFound: No project with this id
+        """
+        return self.get_by_id(groupid)["name"]
+
+    def projects_of(self, orgId):
+        """Get the projects of an organization
+
+        Args:
+            orgId (str): Organization id
+
+        Returns:
+            list of dict: Projects
+        """
+        self.refresh()
+
+        with self._lock:
+            return [self._by_id[groupid] for groupid in self._by_org.get(orgId, ())]
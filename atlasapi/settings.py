@@ -24,6 +24,9 @@ class Settings:
     BASE_URL = 'https://cloud.mongodb.com'
 
     api_resources = {
+        "Root": {
+            "Get Root": "/api/atlas/v1.0"
+        },
         "Database Users": {
             "Get All Database Users": "/api/atlas/v1.0/groups/%s/databaseUsers?pageNum=%d&itemsPerPage=%d",
             "Get a Single Database User": "/api/atlas/v1.0/groups/%s/databaseUsers/admin/%s",
@@ -40,6 +43,7 @@ class Settings:
         "Projects": {
             "Get All Projects": "/api/atlas/v1.0/groups?pageNum=%d&itemsPerPage=%d",
             "Get One Project": "/api/atlas/v1.0/groups/%s",
+            "Get One Project by Name": "/api/atlas/v1.0/groups/byName/%s",
             "Create a Project": "/api/atlas/v1.0/groups"
         },
         "Clusters": {
@@ -64,9 +68,71 @@ class Settings:
     itemsPerPageMin = 1
     itemsPerPageMax = 100
 
-    # Requests
+    # Requests (seconds)
+    requests_connect_timeout = 5
+    # Read timeout
     requests_timeout = 10
 
+    # Connections
+    pool_maxsize = 10
+    dns_ttl = 300
+    prewarm_connections = 4
+
+    # Hedged GET requests
+    hedging_percentile = 0.95
+    hedging_budget = 0.05
+    hedging_min_samples = 20
+    hedging_window = 200
+    hedging_workers = 64
+
+    # Response cache
+    cache_ttl = 300
+    cache_max_bytes = 64 * 1024 * 1024
+    cache_busy_timeout = 10
+    cache_secret_bytes = 32
+
+    # Webhook receiver
+    webhook_reconcile_interval = 300
+    webhook_dedupe_size = 10000
+    webhook_max_body = 1024 * 1024
+
+    # API key pool
+    key_cooldown = 60
+
+    # Circuit breaker
+    circuit_failure_rate = 0.5
+    circuit_min_calls = 10
+    circuit_window = 30
+    circuit_reset_timeout = 30
+    circuit_probes = 1
+
+    # Project index
+    project_index_ttl = 3600
+
+    # Lazy sequences of paginations
+    sequence_cache_pages = 16
+
+    # Bulk operations
+    concurrency = 10
+
+    # Adaptive concurrency (AIMD)
+    adaptive_min_concurrency = 1
+    adaptive_max_concurrency = 64
+    adaptive_backoff = 0.5
+    adaptive_latency_factor = 2.0
+    adaptive_retries = 3
+
+    # Journal
+    journal_fsync_every = 100
+    journal_fsync_interval = 1.0
+
+    # Waiters (seconds)
+    wait_min_interval = 2
+    wait_max_interval = 30
+    wait_backoff = 1.5
+    # Number of watched clusters from which a "Get All Clusters" walk is used instead of single GETs
+    wait_listing_threshold = 2
+
     # HTTP Return code
     SUCCESS = 200
     CREATED = 201
@@ -77,4 +143,5 @@ class Settings:
     NOTFOUND = 404
     METHOD_NOT_ALLOWED = 405
     CONFLICT = 409
+    TOO_MANY_REQUESTS = 429
     SERVER_ERRORS = 500
@@ -18,6 +18,8 @@ Specs module
 Provides some high level objects useful to use the Atlas API.
 """
 
+import json
+
 from .settings import Settings
 from .errors import ErrRole
 
@@ -36,9 +38,123 @@ class RoleSpecs:
     readWrite = "readWrite"
 
 
+class _Roles(list):
+    """List of roles invalidating the cached representations of its owner on change
+
+    Args:
+        owner (DatabaseUsersPermissionsSpecs): Owner of the roles
+        roles (iterable of dict): Roles
+    """
+
+    def __init__(self, owner, roles=()):
+        super().__init__(roles)
+        self._owner = owner
+
+    def append(self, role):
+        super().append(role)
+        self._owner._changed()
+
+    def extend(self, roles):
+        super().extend(roles)
+        self._owner._changed()
+
+    def insert(self, index, role):
+        super().insert(index, role)
+        self._owner._changed()
+
+    def remove(self, role):
+        super().remove(role)
+        self._owner._changed()
+
+    def pop(self, *args):
+        result = super().pop(*args)
+        self._owner._changed()
+        return result
+
+    def clear(self):
+        super().clear()
+        self._owner._changed()
+
+    def sort(self, **kwargs):
+        super().sort(**kwargs)
+        self._owner._changed()
+
+    def reverse(self):
+        super().reverse()
+        self._owner._changed()
+
+    def __setitem__(self, index, value):
+        super().__setitem__(index, value)
+        self._owner._changed()
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._owner._changed()
+
+    def __iadd__(self, roles):
+        super().__iadd__(roles)
+        self._owner._changed()
+        return self
+
+    def __imul__(self, n):
+        super().__imul__(n)
+        self._owner._changed()
+        return self
+
+
+class _FrozenDict(dict):
+    """Read-only dict (still a dict for the JSON encoder)"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("cached specs are read-only, change the specs object instead")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return json.loads(json.dumps(self))
+
+    def __reduce__(self):
+        return _FrozenDict, (dict(self),)
+
+
+def _freeze(value):
+    """Read-only deep copy of a representation
+
+    Args:
+        value: dict, list or scalar
+
+    Returns:
+        _FrozenDict, tuple or scalar
+    """
+    if isinstance(value, dict):
+        return _FrozenDict((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _role_key(role):
+    """Key of a role
+
+    Args:
+        role (dict): Role
+
+    Returns:
+        tuple: (databaseName, roleName, collectionName or None)
+    """
+    return role["databaseName"], role["roleName"], role.get("collectionName") or None
+
+
 class DatabaseUsersPermissionsSpecs:
     """Permissions spec for Database User
 
+    `roles` is a list of role dicts, a role is only added once by add_role. getSpecs() is
+    built once until the roles (list operations included) or the attributes change, and
+    is read-only.
+
     Constructor
 
     Args:
@@ -49,26 +165,73 @@ class DatabaseUsersPermissionsSpecs:
         databaseName (str): Auth Database Name
     """
 
+    # Atlas constraints
+    collectionRoles = frozenset([RoleSpecs.read, RoleSpecs.readWrite])
+    databaseRoles = frozenset([RoleSpecs.read, RoleSpecs.readWrite, RoleSpecs.dbAdmin])
+
     def __init__(self, username, password, databaseName=Settings.databaseName):
         self.username = username
         self.password = password
         self.databaseName = databaseName
-        self.roles = []
+        self._roles = _Roles(self)
+        self._keys = None
+        self._specs = None
+        self._specs_key = None
+
+    @property
+    def roles(self):
+        """list of dict: Roles (list changes are tracked, replace a role instead of editing its dict in place)"""
+        return self._roles
+
+    @roles.setter
+    def roles(self, roles):
+        self._roles = _Roles(self, roles)
+        self._changed()
+
+    def role_keys(self):
+        """Get roles as a set
+
+        Returns:
+            frozenset: (databaseName, roleName, collectionName) tuples
+        """
+        if self._keys is None:
+            self._keys = frozenset(_role_key(role) for role in self._roles)
+
+        return self._keys
+
+    def _changed(self):
+        """Invalidate cached representations"""
+        self._keys = None
+        self._specs = None
+
+    def _cached_specs(self, key, build):
+        """Cache the representation until roles or key change
+
+        Args:
+            key (tuple): Attributes used by the representation
+            build (function): Build the representation
+
+        Returns:
+            dict: Read-only representation (shared by the calls)
+        """
+        if self._specs is None or self._specs_key != key:
+            self._specs = _freeze(build())
+            self._specs_key = key
+
+        return self._specs
 
     def getSpecs(self):
         """Get specs
 
         Returns:
-            dict: Representation of the object
+            dict: Read-only representation of the object
         """
-        content = {
+        return self._cached_specs((self.databaseName, self.username, self.password), lambda: {
             "databaseName": self.databaseName,
             "roles": self.roles,
             "username": self.username,
             "password": self.password
-        }
-
-        return content
+        })
 
     def add_roles(self, databaseName, roleNames, collectionName=None):
         """Add multiple roles
@@ -99,22 +262,25 @@ class DatabaseUsersPermissionsSpecs:
         Raises:
             ErrRole: role not compatible with the databaseName and/or collectionName
         """
-        role = {"databaseName": databaseName,
-                "roleName": roleName}
-
-        if collectionName:
-            role["collectionName"] = collectionName
-
         # Check atlas constraints
-        if collectionName and roleName not in [RoleSpecs.read, RoleSpecs.readWrite]:
+        if collectionName and roleName not in self.collectionRoles:
             raise ErrRole(
                 "Permissions [%s] not available for a collection" % roleName)
-        elif not collectionName and roleName not in [RoleSpecs.read, RoleSpecs.readWrite, RoleSpecs.dbAdmin] and databaseName != "admin":
+        elif not collectionName and roleName not in self.databaseRoles and databaseName != "admin":
             raise ErrRole(
                 "Permissions [%s] is only available for admin database" % roleName)
 
-        if role not in self.roles:
-            self.roles.append(role)
+        key = (databaseName, roleName, collectionName or None)
+        if key in self.role_keys():
+            return
+
+        role = {"databaseName": databaseName,
+                "roleName": roleName}
+
+        if collectionName:
+            role["collectionName"] = collectionName
+
+        self._roles.append(role)
 
     def remove_roles(self, databaseName, roleNames, collectionName=None):
         """Remove multiple roles
@@ -139,17 +305,13 @@ class DatabaseUsersPermissionsSpecs:
         Keyword Args:
             collectionName (str): Collection
         """
-        role = {"databaseName": databaseName,
-                "roleName": roleName}
-
-        if collectionName:
-            role["collectionName"] = collectionName
-
-        if role in self.roles:
-            self.roles.remove(role)
+        key = (databaseName, roleName, collectionName or None)
+        if key in self.role_keys():
+            self._roles[:] = [role for role in self._roles if _role_key(role) != key]
 
     def clear_roles(self):
-        self.roles.clear()
+        """Remove all roles"""
+        self._roles.clear()
 
 
 class DatabaseUsersUpdatePermissionsSpecs(DatabaseUsersPermissionsSpecs):
@@ -170,10 +332,17 @@ class DatabaseUsersUpdatePermissionsSpecs(DatabaseUsersPermissionsSpecs):
         Returns:
             dict: Representation of the object
         """
+        return self._cached_specs((self.password,), self._build_specs)
+
+    def _build_specs(self):
+        """Build specs
 
+        Returns:
+            dict: Representation of the object
+        """
         content = {}
 
-        if len(self.roles) != 0:
+        if len(self._roles) != 0:
             content["roles"] = self.roles
 
         if self.password:
@@ -187,3 +356,13 @@ class AlertStatusSpec:
     TRACKING = "TRACKING"
     OPEN = "OPEN"
     CLOSED = "CLOSED"
+
+
+class ClusterStatesSpec:
+    """Cluster States"""
+    IDLE = "IDLE"
+    CREATING = "CREATING"
+    UPDATING = "UPDATING"
+    DELETING = "DELETING"
+    DELETED = "DELETED"
+    REPAIRING = "REPAIRING"
@@ -0,0 +1,426 @@
+# Copyright (c) 2018 Yellow Pages Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Testing module
+
+In-process fake of the Atlas APIs for the test suites of code built on atlasapi
+"""
+
+import copy
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from urllib.parse import unquote, urlsplit
+
+import requests
+
+from .settings import Settings
+from .specs import AlertStatusSpec, ClusterStatesSpec
+from .transport import Transport
+
+_METHODS = {"Get": "GET", "Create": "POST", "Update": "PATCH", "Delete": "DELETE", "Acknowledge": "PATCH"}
+
+
+class _Fail(Exception):
+    """Error answer of the fake"""
+
+    def __init__(self, status, errorCode, detail):
+        super().__init__(detail)
+        self.status = status
+        self.details = {"detail": detail, "error": status, "errorCode": errorCode, "parameters": [],
+                        "reason": errorCode.replace("_", " ").title()}
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _new_id():
+    return uuid.uuid4().hex[:24]
+
+
+class FakeAtlas(Transport):
+    """In-process fake of the Atlas APIs (thread safe)
+
+    Every endpoint of Settings.api_resources is served from memory with stateful
+    CRUD semantics: pagination and totalCount, 404 on missing resources, 409 on
+    duplicates. No socket is opened.
+
+    Latency and faults can be injected, per endpoint ((resource group, operation)).
+
+    .. code:: python
+
+        fake = FakeAtlas()
+        group = fake.add_project("project-dev")
+        fake.add_cluster(group, "cluster-dev")
+
+        a = Atlas("<user>", "<password>", group, transport=fake)
+        a.Clusters.is_existing_cluster("cluster-dev")
+
+    Constructor
+
+    Keyword Args:
+        latency (float or function): Seconds per request, or function(endpoint) returning them.
+                                     Above the read timeout, requests.ReadTimeout is raised.
+        fail_rate (float): Ratio of requests failing with fail_status
+        fail_status (int): HTTP status of the random failures
+        seed (int): Seed of the random failures
+    """
+
+    def __init__(self, latency=0, fail_rate=0.0, fail_status=Settings.SERVER_ERRORS, seed=None):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+
+        # Requests per endpoint
+        self.requests = Counter()
+
+        self.projects = OrderedDict()
+        self.groups = {}
+
+        self._lock = threading.RLock()
+        self._random = random.Random(seed)
+        self._faults = []
+        self._routes = self._build_routes()
+
+    def _handlers(self):
+        """Handlers of the endpoints
+
+        Returns:
+            dict: (resource group, operation) -> function(*uri parameters, payload) returning (status, details)
+        """
+        return {
+            ("Root", "Get Root"): self._get_root,
+            ("Database Users", "Get All Database Users"): self._lister("users"),
+            ("Database Users", "Get a Single Database User"): self._getter("users", "USER_NOT_FOUND"),
+            ("Database Users", "Create a Database User"): self._create_user,
+            ("Database Users", "Update a Database User"): self._update_user,
+            ("Database Users", "Delete a Database User"): self._deleter("users", "USER_NOT_FOUND"),
+            ("Whitelist", "Get All Whitelist Entries"): self._lister("whitelist"),
+            ("Whitelist", "Get Whitelist Entry"): self._getter("whitelist", "ATLAS_WHITELIST_NOT_FOUND"),
+            ("Whitelist", "Create Whitelist Entry"): self._create_whitelist,
+            ("Whitelist", "Delete Whitelist Entry"): self._deleter("whitelist", "ATLAS_WHITELIST_NOT_FOUND"),
+            ("Projects", "Get All Projects"): self._list_projects,
+            ("Projects", "Get One Project"): self._get_project,
+            ("Projects", "Get One Project by Name"): self._get_project_by_name,
+            ("Projects", "Create a Project"): self._create_project,
+            ("Clusters", "Get All Clusters"): self._lister("clusters"),
+            ("Clusters", "Get a Single Cluster"): self._getter("clusters", "CLUSTER_NOT_FOUND"),
+            ("Clusters", "Delete a Cluster"): self._deleter("clusters", "CLUSTER_NOT_FOUND", Settings.ACCEPTED),
+            ("Alerts", "Get All Alerts"): self._lister("alerts"),
+            ("Alerts", "Get All Alerts with status"): self._list_alerts_with_status,
+            ("Alerts", "Get an Alert"): self._getter("alerts", "ALERT_NOT_FOUND"),
+            ("Alerts", "Acknowledge an Alert"): self._acknowledge_alert,
+        }
+
+    def _build_routes(self):
+        """Compile the resources of Settings.api_resources
+
+        Returns:
+            list: (method, regex, endpoint, handler)
+
+        Raises:
+            NotImplementedError: An endpoint without handler
+        """
+        handlers = self._handlers()
+        routes = []
+        for group, operations in Settings.api_resources.items():
+            for operation, resource in operations.items():
+                endpoint = (group, operation)
+                if endpoint not in handlers:
+                    raise NotImplementedError("FakeAtlas does not handle [%s / %s]" % endpoint)
+
+                parts = re.split(r"(%s|%d)", resource)
+                regex = "".join(r"([^/?&]+)" if part == "%s" else r"(\d+)" if part == "%d" else re.escape(part)
+                                for part in parts)
+                routes.append((_METHODS[operation.split(" ", 1)[0]], re.compile(regex + "$"), endpoint,
+                               handlers[endpoint]))
+        return routes
+
+    def inject(self, failure, endpoint=None, count=1):
+        """Inject failures
+
+        Args:
+            failure (int or Exception): HTTP status to answer or exception to raise
+                                        (eg: requests.ConnectionError())
+
+        Keyword Args:
+            endpoint (tuple): (resource group, operation) or None for any endpoint
+            count (int): Number of requests failing
+        """
+        with self._lock:
+            self._faults.append([endpoint, failure, count])
+
+    def request(self, method, uri, payload=None, timeout=None):
+        """Serve a request (see Transport)"""
+        url = urlsplit(uri)
+        target = url.path + ("?" + url.query if url.query else "")
+
+        for route_method, regex, endpoint, handler in self._routes:
+            match = regex.match(target) if route_method == method else None
+            if match:
+                break
+        else:
+            endpoint = handler = match = None
+
+        self._wait(endpoint, timeout)
+
+        if payload is not None:
+            # as sent on the wire (eg: read-only specs, tuples)
+            payload = json.loads(json.dumps(payload))
+
+        with self._lock:
+            self.requests[endpoint] += 1
+
+            failure = self._fault(endpoint)
+            if isinstance(failure, BaseException) or isinstance(failure, type):
+                raise failure
+            if failure is not None:
+                return failure, _Fail(failure, "INJECTED_FAULT", "Injected fault").details
+
+            try:
+                if handler is None:
+                    raise _Fail(Settings.NOTFOUND, "RESOURCE_NOT_FOUND", "Cannot find resource %s" % url.path)
+
+                args = [unquote(value) if value is not None else None for value in match.groups()]
+                status, details = handler(*(args + [payload]))
+                return status, copy.deepcopy(details)
+            except _Fail as e:
+                return e.status, e.details
+
+    def _wait(self, endpoint, timeout):
+        """Simulate the latency
+
+        Args:
+            endpoint (tuple): (resource group, operation)
+            timeout (tuple): (connect, read) timeouts
+
+        Raises:
+            requests.ReadTimeout: Latency above the read timeout
+        """
+        latency = self.latency(endpoint) if callable(self.latency) else self.latency
+        if not latency:
+            return
+
+        if timeout is not None and latency > timeout[1]:
+            time.sleep(timeout[1])
+            raise requests.ReadTimeout("FakeAtlas latency %.3fs above the read timeout" % latency)
+
+        time.sleep(latency)
+
+    def _fault(self, endpoint):
+        """Get the failure of a request (lock held)
+
+        Args:
+            endpoint (tuple): (resource group, operation)
+
+        Returns:
+            int or Exception: Failure or None
+        """
+        for fault in self._faults:
+            if fault[0] is None or fault[0] == endpoint:
+                fault[2] -= 1
+                if fault[2] <= 0:
+                    self._faults.remove(fault)
+                return fault[1]
+
+        if self.fail_rate and self._random.random() < self.fail_rate:
+            return self.fail_status
+
+        return None
+
+    # Data setup
+
+    def add_project(self, name, orgId=None, groupid=None):
+        """Add a project
+
+        Args:
+            name (str): Project name
+
+        Keyword Args:
+            orgId (str): Organization id
+            groupid (str): Project id (generated by default)
+
+        Returns:
+            str: Project id
+        """
+        status, project = self._create_project({"name": name, "orgId": orgId}, groupid)
+        return project["id"]
+
+    def add_cluster(self, group, name, **fields):
+        """Add a cluster
+
+        Args:
+            group (str): Project id
+            name (str): Cluster name
+            **fields: Other fields (eg: stateName, mongoDBVersion)
+
+        Returns:
+            dict: The cluster
+        """
+        cluster = {"name": name, "groupId": group, "stateName": ClusterStatesSpec.IDLE, "mongoDBVersion": "3.6",
+                   "providerSettings": {"providerName": "AWS", "instanceSizeName": "M10"}}
+        cluster.update(fields)
+        with self._lock:
+            self._group(group)["clusters"][name] = cluster
+            self.projects[group]["clusterCount"] = len(self.groups[group]["clusters"])
+        return cluster
+
+    def add_alert(self, group, eventTypeName="HOST_DOWN", status=AlertStatusSpec.OPEN, **fields):
+        """Add an alert
+
+        Args:
+            group (str): Project id
+
+        Keyword Args:
+            eventTypeName (str): Event type
+            status (AlertStatusSpec): Status
+            **fields: Other fields (eg: clusterName)
+
+        Returns:
+            dict: The alert
+        """
+        alert = {"id": _new_id(), "groupId": group, "alertConfigId": _new_id(), "eventTypeName": eventTypeName,
+                 "status": status, "created": _now(), "updated": _now(), "links": []}
+        alert.update(fields)
+        with self._lock:
+            self._group(group)["alerts"][alert["id"]] = alert
+        return alert
+
+    # Handlers
+
+    def _group(self, group):
+        try:
+            return self.groups[group]
+        except KeyError:
+            raise _Fail(Settings.NOTFOUND, "GROUP_NOT_FOUND", "No group with ID %s exists." % group)
+
+    @staticmethod
+    def _page(items, pageNum, itemsPerPage):
+        pageNum, itemsPerPage = int(pageNum), int(itemsPerPage)
+        start = (pageNum - 1) * itemsPerPage
+        return Settings.SUCCESS, {"results": items[start:start + itemsPerPage], "totalCount": len(items),
+                                  "links": []}
+
+    def _lister(self, collection):
+        def handler(group, pageNum, itemsPerPage, payload):
+            return self._page(list(self._group(group)[collection].values()), pageNum, itemsPerPage)
+        return handler
+
+    def _getter(self, collection, errorCode):
+        def handler(group, key, payload):
+            try:
+                return Settings.SUCCESS, self._group(group)[collection][key]
+            except KeyError:
+                raise _Fail(Settings.NOTFOUND, errorCode, "%s not found in group %s" % (key, group))
+        return handler
+
+    def _deleter(self, collection, errorCode, status=Settings.SUCCESS):
+        def handler(group, key, payload):
+            items = self._group(group)[collection]
+            if key not in items:
+                raise _Fail(Settings.NOTFOUND, errorCode, "%s not found in group %s" % (key, group))
+            del items[key]
+            if collection == "clusters":
+                self.projects[group]["clusterCount"] = len(items)
+            return status, {}
+        return handler
+
+    def _get_root(self, payload):
+        return Settings.SUCCESS, {"appName": "MongoDB Atlas", "build": "fake", "throttling": False, "links": []}
+
+    def _create_user(self, group, payload):
+        users = self._group(group)["users"]
+        if payload["username"] in users:
+            raise _Fail(Settings.CONFLICT, "USER_ALREADY_EXISTS",
+                        "The user %s already exists." % payload["username"])
+
+        user = {key: value for key, value in payload.items() if key != "password"}
+        user["groupId"] = group
+        users[user["username"]] = user
+        return Settings.CREATED, user
+
+    def _update_user(self, group, username, payload):
+        users = self._group(group)["users"]
+        if username not in users:
+            raise _Fail(Settings.NOTFOUND, "USER_NOT_FOUND", "%s not found in group %s" % (username, group))
+
+        users[username].update((key, value) for key, value in payload.items() if key != "password")
+        return Settings.SUCCESS, users[username]
+
+    def _create_whitelist(self, group, payload):
+        entries = self._group(group)["whitelist"]
+        if not isinstance(payload, list):
+            raise _Fail(Settings.BAD_REQUEST, "INVALID_JSON", "A list of whitelist entries is expected.")
+
+        for item in payload:
+            address = item.get("ipAddress")
+            entry = {"cidrBlock": item.get("cidrBlock") or "%s/32" % address, "comment": item.get("comment"),
+                     "groupId": group, "links": []}
+            if address:
+                entry["ipAddress"] = address
+            entries[address or entry["cidrBlock"]] = entry
+
+        status, page = self._page(list(entries.values()), 1, max(1, len(entries)))
+        return Settings.CREATED, page
+
+    def _list_projects(self, pageNum, itemsPerPage, payload):
+        return self._page(list(self.projects.values()), pageNum, itemsPerPage)
+
+    def _get_project(self, group, payload):
+        try:
+            return Settings.SUCCESS, self.projects[group]
+        except KeyError:
+            raise _Fail(Settings.NOTFOUND, "GROUP_NOT_FOUND", "No group with ID %s exists." % group)
+
+    def _get_project_by_name(self, name, payload):
+        for project in self.projects.values():
+            if project["name"] == name:
+                return Settings.SUCCESS, project
+        raise _Fail(Settings.NOTFOUND, "GROUP_NAME_NOT_FOUND", "No group with name %s exists." % name)
+
+    def _create_project(self, payload, groupid=None):
+        name = payload["name"]
+        with self._lock:
+            if any(project["name"] == name for project in self.projects.values()):
+                raise _Fail(Settings.CONFLICT, "GROUP_ALREADY_EXISTS", "A group with name %s already exists." % name)
+
+            project = {"id": groupid or _new_id(), "name": name,
+                       "orgId": payload.get("orgId") or "5a0a1e7e0f2912c554080adc",
+                       "created": _now(), "clusterCount": 0, "links": []}
+            self.projects[project["id"]] = project
+            self.groups[project["id"]] = {"users": OrderedDict(), "whitelist": OrderedDict(),
+                                          "clusters": OrderedDict(), "alerts": OrderedDict()}
+        return Settings.CREATED, project
+
+    def _list_alerts_with_status(self, group, status, pageNum, itemsPerPage, payload):
+        alerts = [alert for alert in self._group(group)["alerts"].values() if alert["status"] == status]
+        return self._page(alerts, pageNum, itemsPerPage)
+
+    def _acknowledge_alert(self, group, alert, payload):
+        alerts = self._group(group)["alerts"]
+        if alert not in alerts:
+            raise _Fail(Settings.NOTFOUND, "ALERT_NOT_FOUND", "%s not found in group %s" % (alert, group))
+
+        alerts[alert].update(payload)
+        alerts[alert]["acknowledgingUsername"] = "fake"
+        alerts[alert]["updated"] = _now()
+        return Settings.SUCCESS, alerts[alert]
@@ -0,0 +1,50 @@
+# Copyright (c) 2018 Yellow Pages Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Transport module
+
+Interface of the layer sending the requests of Network
+"""
+
+
+class Transport:
+    """Transport interface
+
+    By default Network sends the requests over HTTP with requests (connection pools,
+    digest authentication, compression). A transport replaces this layer, eg: the
+    in-process atlasapi.testing.FakeAtlas. Network keeps handling timeouts, deadlines,
+    circuit breakers, hooks, hedging, cache and errors (from the status).
+    """
+
+    def request(self, method, uri, payload=None, timeout=None):
+        """Send a request
+
+        Args:
+            method (str): HTTP method
+            uri (str): URI (Settings.BASE_URL + resource)
+
+        Keyword Args:
+            payload (dict or list): Content to send
+            timeout (tuple): (connect, read) timeouts
+
+        Returns:
+            tuple: (HTTP status, response payload)
+
+        Raises:
+            requests.Timeout: Timeout
+            requests.ConnectionError: Network issue
+        """
+        raise NotImplementedError()
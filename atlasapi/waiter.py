@@ -0,0 +1,297 @@
+# Copyright (c) 2018 Yellow Pages Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Waiter module
+
+Wait for Atlas resources to reach a state with one shared polling loop
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+
+from .errors import ErrAtlasGeneric, ErrAtlasNotFound, ErrCircuitOpen, ErrPagination, ErrWaitTimeout
+from .settings import Settings
+from .specs import ClusterStatesSpec
+
+
+class _Waiter:
+    """One registered waiter
+
+    Constructor
+
+    Args:
+        names (set of str): Cluster names
+        targets (set of str): Accepted states
+        deadline (float): time.monotonic() deadline or None
+    """
+
+    def __init__(self, names, targets, deadline):
+        self.names = names
+        self.targets = targets
+        self.deadline = deadline
+        self.states = {}
+        self.future = Future()
+
+    def update(self, states):
+        """Update known states and resolve the waiter if possible
+
+        Args:
+            states (dict): Cluster name -> state
+
+        Returns:
+            bool: The waiter is resolved
+        """
+        for name in self.names:
+            if name in states:
+                self.states[name] = states[name]
+
+        if all(self.states.get(name) in self.targets for name in self.names):
+            self.settle(result=dict(self.states))
+            return True
+
+        return False
+
+    def expire(self, now):
+        """Fail the waiter if the deadline is reached
+
+        Args:
+            now (float): time.monotonic() value
+
+        Returns:
+            bool: The waiter is expired
+        """
+        if self.deadline is not None and now >= self.deadline:
+            self.settle(error=ErrWaitTimeout(dict(self.states)))
+            return True
+
+        return False
+
+    def settle(self, result=None, error=None):
+        """Resolve the future unless it was cancelled
+
+        Keyword Args:
+            result (dict): Cluster name -> state
+            error (Exception): Failure reported instead of a result
+        """
+        # Moves the future out of PENDING atomically, a late cancel() is a no-op
+        if not self.future.set_running_or_notify_cancel():
+            return
+
+        if error is None:
+            self.future.set_result(result)
+        else:
+            self.future.set_exception(error)
+
+
+def _cause(error):
+    """Unwrap the issue behind a pagination error
+
+    Args:
+        error (Exception): Error raised by a tick
+
+    Returns:
+        Exception: The cause of an ErrPagination, the error itself otherwise
+    """
+    if isinstance(error, ErrPagination) and error.__cause__ is not None:
+        return error.__cause__
+    return error
+
+
+def _transient(error):
+    """Check if a polling error is worth retrying
+
+    A pagination issue is classified on its cause.
+
+    Args:
+        error (Exception): Error raised by a tick
+
+    Returns:
+        bool: Network issue, open circuit, 429 or 5xx
+    """
+    error = _cause(error)
+
+    if isinstance(error, (requests.RequestException, ErrCircuitOpen)):
+        return True
+
+    if isinstance(error, ErrAtlasGeneric):
+        status = error.getAtlasResponse()[0]
+        return status == Settings.TOO_MANY_REQUESTS or status >= Settings.SERVER_ERRORS
+
+    return False
+
+
+class ClusterStateWatcher:
+    """Poll clusters state for many waiters at once
+
+    All waiters share the same polling thread. On each tick, the watcher fetches
+    the state of every watched cluster, either with one "Get All Clusters" walk
+    or with single GETs when only few clusters are watched.
+
+    The polling interval starts at `min_interval`, grows by `backoff` on every
+    tick without state change and goes back to `min_interval` on a change.
+
+    Constructor
+
+    Args:
+        atlas (Atlas): Atlas instance
+
+    Keyword Args:
+        min_interval (float): Minimum seconds between 2 ticks
+        max_interval (float): Maximum seconds between 2 ticks
+        backoff (float): Interval multiplier when nothing changed
+    """
+
+    def __init__(self, atlas, min_interval=Settings.wait_min_interval, max_interval=Settings.wait_max_interval,
+                 backoff=Settings.wait_backoff):
+        self.atlas = atlas
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._thread = None
+        self._last_states = {}
+
+    def watch(self, names, targets, timeout=None):
+        """Register a waiter
+
+        Args:
+            names (iterable of str): Cluster names
+            targets (iterable of str): Accepted states
+
+        Keyword Args:
+            timeout (float): Seconds before failing with ErrWaitTimeout
+
+        Returns:
+            Future: Resolved with a dict cluster name -> state
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        waiter = _Waiter(set(names), set(targets), deadline)
+
+        with self._cond:
+            self._waiters.append(waiter)
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="atlasapi-cluster-watcher", daemon=True)
+                self._thread.start()
+            else:
+                # a new waiter should not wait for a backed-off tick
+                self._cond.notify()
+
+        return waiter.future
+
+    def poll(self, names):
+        """Fetch the current state of clusters
+
+        A missing cluster is reported as DELETED. The response cache is bypassed.
+
+        Args:
+            names (set of str): Cluster names
+
+        Returns:
+            dict: Cluster name -> state
+        """
+        if len(names) >= Settings.wait_listing_threshold:
+            states = dict.fromkeys(names, ClusterStatesSpec.DELETED)
+            for cluster in self.atlas.Clusters.get_all_clusters(iterable=True, cache=False):
+                if cluster["name"] in states:
+                    states[cluster["name"]] = cluster["stateName"]
+            return states
+
+        states = {}
+        for name in names:
+            try:
+                states[name] = self.atlas.Clusters.get_a_single_cluster(name, cache=False)["stateName"]
+            except ErrAtlasNotFound:
+                states[name] = ClusterStatesSpec.DELETED
+        return states
+
+    def _run(self):
+        """Polling thread
+
+        The thread is always released, an unexpected error fails the remaining waiters.
+        """
+        try:
+            self._loop()
+        except Exception as e:
+            with self._cond:
+                if self._thread is threading.current_thread():
+                    for waiter in self._waiters:
+                        waiter.settle(error=e)
+                    self._waiters = []
+            raise
+        finally:
+            with self._cond:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+                    self._last_states = {}
+
+    def _loop(self):
+        """Polling loop, returns once no waiter is left"""
+        interval = self.min_interval
+
+        while True:
+            with self._cond:
+                self._waiters = [w for w in self._waiters if not w.future.cancelled()]
+                if not self._waiters:
+                    # released under the lock, a concurrent watch() starts a new thread
+                    self._thread = None
+                    self._last_states = {}
+                    return
+
+                names = set()
+                for waiter in self._waiters:
+                    names |= waiter.names
+
+            error = None
+            try:
+                states = self.poll(names)
+            except Exception as e:
+                # Transient issues are retried, waiters will time out if it persists
+                states = {}
+                if not _transient(e):
+                    error = _cause(e)
+
+            changed = any(self._last_states.get(name) != state for name, state in states.items())
+            self._last_states.update(states)
+            interval = self.min_interval if changed else min(interval * self.backoff, self.max_interval)
+
+            with self._cond:
+                if error is not None:
+                    # 401, 403, ... will not go away, the polled waiters get the error
+                    for waiter in self._waiters:
+                        if waiter.names & names:
+                            waiter.settle(error=error)
+                    self._waiters = [w for w in self._waiters if not w.names & names]
+
+                now = time.monotonic()
+                self._waiters = [w for w in self._waiters if not (w.update(states) or w.expire(now))]
+
+                if not self._waiters:
+                    # released under the lock, a concurrent watch() starts a new thread
+                    self._thread = None
+                    self._last_states = {}
+                    return
+
+                deadlines = [w.deadline for w in self._waiters if w.deadline is not None]
+                wait = min([interval] + [d - now for d in deadlines])
+
+                # notify() on a new waiter shortens the wait
+                if self._cond.wait(max(wait, 0)):
+                    interval = self.min_interval
@@ -0,0 +1,278 @@
+# Copyright (c) 2018 Yellow Pages Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Webhook module
+
+Receive Atlas alerts pushed by a webhook integration instead of polling
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+from collections import OrderedDict
+
+from .atlas import AlertsGetAll
+from .errors import ErrAtlasNotFound
+from .settings import Settings
+from .specs import AlertStatusSpec
+
+# Fields of an alert as returned by Alerts.get_an_alert
+ALERT_FIELDS = frozenset([
+    "id", "groupId", "alertConfigId", "eventTypeName", "created", "updated", "status", "resolved",
+    "lastNotified", "acknowledgedUntil", "acknowledgementComment", "acknowledgingUsername",
+    "typeName", "clusterId", "clusterName", "hostnameAndPort", "replicaSetName", "metricName",
+    "currentValue", "links"])
+
+REQUIRED_FIELDS = ("id", "groupId", "eventTypeName", "status")
+
+
+def normalize(payload):
+    """Normalize a webhook payload into an alert
+
+    Args:
+        payload (dict): Webhook payload
+
+    Returns:
+        dict: Alert with the fields of Alerts.get_an_alert
+
+    Raises:
+        ValueError: Not an alert
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("Payload is not an object")
+
+    missing = [field for field in REQUIRED_FIELDS if not payload.get(field)]
+    if missing:
+        raise ValueError("Missing fields [%s]" % ", ".join(missing))
+
+    return {field: value for field, value in payload.items() if field in ALERT_FIELDS}
+
+
+def signature(secret, body):
+    """Get the signature of a webhook body
+
+    Atlas signs with HMAC-SHA1 of the body, base64 encoded in the X-MMS-Signature header.
+
+    Args:
+        secret (str): Webhook secret
+        body (bytes): Request body
+
+    Returns:
+        str: Signature
+    """
+    return base64.b64encode(hmac.new(secret.encode("utf-8"), body, hashlib.sha1).digest()).decode("ascii")
+
+
+class AlertReceiver:
+    """Asyncio HTTP receiver of Atlas webhook alerts
+
+    Valid alerts are normalized and put in queue. Deliveries are deduplicated by alert
+    id and status (a status change is a new event). With an Atlas instance, open alerts
+    are reconciled periodically through AlertsGetAll to catch missed deliveries, and
+    alerts known as open but missing from the listing are fetched again.
+
+    Constructor
+
+    Keyword Args:
+        atlas (Atlas): Atlas instance for the reconciliation (None to disable)
+        host (str): Listening address
+        port (int): Listening port (0 for any free port)
+        secret (str): Webhook secret to check X-MMS-Signature (None to accept unsigned payloads)
+        queue (asyncio.Queue): Queue of alerts (a new one by default)
+        reconcile_interval (float): Seconds between reconciliations
+        dedupe_size (int): Number of deliveries remembered
+    """
+
+    def __init__(self, atlas=None, host="127.0.0.1", port=8080, secret=None, queue=None,
+                 reconcile_interval=Settings.webhook_reconcile_interval, dedupe_size=Settings.webhook_dedupe_size):
+        self.atlas = atlas
+        self.host = host
+        self.port = port
+        self.secret = secret
+        self.queue = queue if queue is not None else asyncio.Queue()
+        self.reconcile_interval = reconcile_interval
+        self.dedupe_size = dedupe_size
+
+        self.stats = {"received": 0, "duplicates": 0, "rejected": 0, "reconciled": 0}
+
+        self._seen = OrderedDict()
+        self._open = set()
+        self._server = None
+        self._reconciler = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def start(self):
+        """Start listening (and reconciling)"""
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+        if self.atlas is not None and self.reconcile_interval:
+            self._reconciler = asyncio.ensure_future(self._reconcile_loop())
+
+    async def stop(self):
+        """Stop listening (and reconciling)"""
+        if self._reconciler is not None:
+            self._reconciler.cancel()
+            try:
+                await self._reconciler
+            except asyncio.CancelledError:
+                pass
+            self._reconciler = None
+
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def publish(self, alert):
+        """Put an alert in the queue unless already delivered
+
+        Args:
+            alert (dict): Normalized alert
+
+        Returns:
+            bool: The alert was queued
+        """
+        key = (alert["id"], alert["status"])
+        if key in self._seen:
+            self._seen.move_to_end(key)
+            self.stats["duplicates"] += 1
+            return False
+
+        self._seen[key] = True
+        if len(self._seen) > self.dedupe_size:
+            self._seen.popitem(last=False)
+
+        if alert["status"] == AlertStatusSpec.OPEN:
+            self._open.add(alert["id"])
+        else:
+            self._open.discard(alert["id"])
+
+        await self.queue.put(alert)
+        return True
+
+    async def _handle(self, reader, writer):
+        """Serve one HTTP request
+
+        Args:
+            reader (StreamReader): Reader
+            writer (StreamWriter): Writer
+        """
+        try:
+            status = await self._receive(reader)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            status = 400
+
+        if status >= 400:
+            self.stats["rejected"] += 1
+
+        reason = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 405: "Method Not Allowed",
+                  413: "Payload Too Large"}[status]
+        writer.write(("HTTP/1.1 %d %s\r\nContent-Length: 0\r\nConnection: close\r\n\r\n" % (
+            status, reason)).encode("ascii"))
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _receive(self, reader):
+        """Read and process one webhook delivery
+
+        Args:
+            reader (StreamReader): Reader
+
+        Returns:
+            int: HTTP status of the answer
+        """
+        head = await reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        method = lines[0].split(" ", 1)[0]
+
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        if method != "POST":
+            return 405
+
+        length = int(headers.get("content-length", "0"))
+        if length > Settings.webhook_max_body:
+            return 413
+        body = await reader.readexactly(length)
+
+        if self.secret is not None:
+            provided = headers.get("x-mms-signature", "")
+            if not hmac.compare_digest(provided, signature(self.secret, body)):
+                return 401
+
+        alert = normalize(json.loads(body.decode("utf-8")))
+        self.stats["received"] += 1
+        await self.publish(alert)
+        return 200
+
+    async def _reconcile_loop(self):
+        """Reconcile periodically"""
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                await self.reconcile()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Next reconciliation will retry
+                pass
+
+    async def reconcile(self):
+        """Catch missed deliveries
+
+        Open alerts are listed through AlertsGetAll, alerts known as open but not
+        listed anymore are fetched again (closed or acknowledged meanwhile). The
+        response cache is bypassed.
+
+        Returns:
+            int: Number of alerts queued
+        """
+        loop = asyncio.get_event_loop()
+        listed = await loop.run_in_executor(
+            None, lambda: list(AlertsGetAll(self.atlas, AlertStatusSpec.OPEN, 1, Settings.itemsPerPage, cache=False)))
+
+        vanished = self._open - set(alert["id"] for alert in listed)
+        for alert_id in vanished:
+            try:
+                listed.append(await loop.run_in_executor(
+                    None, lambda: self.atlas.Alerts.get_an_alert(alert_id, cache=False)))
+            except ErrAtlasNotFound:
+                self._open.discard(alert_id)
+
+        queued = 0
+        for alert in listed:
+            if await self.publish(normalize(alert)):
+                queued += 1
+
+        self.stats["reconciled"] += queued
+        return queued
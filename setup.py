@@ -4,9 +4,14 @@ from setuptools import setup, find_packages
 setup(
     name='atlasapi',
     version='0.5.4',
-    python_requires='>=3.5',
+    python_requires='>=3.6',
     packages=find_packages(),
     install_requires=['requests', 'python-dateutil'],
+    entry_points={
+        'console_scripts': [
+            'atlasapi=atlasapi.cli:main',
+        ],
+    },
 
     # Metadata
     author="Yellow Pages Inc.",
@@ -34,10 +39,15 @@ setup(
         # Specify the Python versions you support here. In particular, ensure
         # that you indicate whether you support Python 2, Python 3 or both.
         'Programming Language :: Python :: 3 :: Only',
-        'Programming Language :: Python :: 3.5',
         'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
     ],
-    extras_require={}
+    extras_require={
+        'numpy': ['numpy'],
+        'pandas': ['numpy', 'pandas'],
+        'arrow': ['numpy', 'pyarrow'],
+        'zstd': ['zstandard'],
+        'brotli': ['brotli'],
+    }
 
 )
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# Copyright (c) 2018 Yellow Pages Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Startup latency benchmark
+
+Latency of the first request of a freshly constructed Atlas instance, against the
+digest protected mock server (tests/mockserver.py):
+
+- cold: the first request pays DNS resolution, connection and the digest challenge
+- prewarm: Atlas(..., prewarm=True), the worker initializes for --init seconds meanwhile
+- prewarm(): explicit blocking prewarm before the first request
+
+DNS resolution and network round trips are simulated with --dns and --rtt.
+
+usage: python tests/bench_startup.py [--runs 20] [--rtt 0.02] [--dns 0.03] [--init 0.1]
+"""
+
+import argparse
+import ipaddress
+import os
+import socket
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mockserver import MockAtlas
+
+from atlasapi.atlas import Atlas
+from atlasapi.settings import Settings
+
+
+def slow_dns(delay):
+    """Add a delay to every DNS resolution of a host name
+
+    Args:
+        delay (float): Seconds
+    """
+    getaddrinfo = socket.getaddrinfo
+
+    def resolve(host, *args, **kwargs):
+        try:
+            ipaddress.ip_address(host)
+        except ValueError:
+            time.sleep(delay)
+        return getaddrinfo(host, *args, **kwargs)
+
+    socket.getaddrinfo = resolve
+
+
+def first_request(mode, init):
+    """Construct an Atlas instance and time its first request
+
+    Args:
+        mode (str): "cold", "prewarm" or "prewarm()"
+        init (float): Seconds of worker initialization before the first request
+
+    Returns:
+        tuple: (first request latency, construction to first response) in seconds
+    """
+    start = time.monotonic()
+    atlas = Atlas("user", "password", "group0", prewarm=(mode == "prewarm"))
+    if mode == "prewarm()":
+        atlas.prewarm()
+
+    time.sleep(init)
+
+    sent = time.monotonic()
+    atlas.Clusters.get_a_single_cluster("c0")
+    end = time.monotonic()
+
+    return end - sent, end - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency of the first request of a new Atlas instance")
+    parser.add_argument("--runs", type=int, default=20, help="Atlas instances per mode")
+    parser.add_argument("--rtt", type=float, default=0.02, help="Simulated round trip per response (seconds)")
+    parser.add_argument("--dns", type=float, default=0.03, help="Simulated DNS resolution (seconds)")
+    parser.add_argument("--init", type=float, default=0.1, help="Worker initialization before the first request")
+    args = parser.parse_args()
+
+    mock = MockAtlas(rtt=args.rtt)
+    Settings.BASE_URL = mock.url
+    slow_dns(args.dns)
+
+    results = {}
+    try:
+        for mode in ("cold", "prewarm", "prewarm()"):
+            mock.reset()
+            runs = [first_request(mode, args.init) for _ in range(args.runs)]
+            results[mode] = statistics.median(run[0] for run in runs)
+
+            print("%-10s first request %6.1f ms (median), construction to response %6.1f ms, "
+                  "%.1f challenge(s) per instance" % (
+                      mode, results[mode] * 1000, statistics.median(run[1] for run in runs) * 1000,
+                      mock.challenges / args.runs))
+    finally:
+        mock.close()
+
+    print("prewarm saves %.1f ms on the first request" % ((results["cold"] - results["prewarm"]) * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# Copyright (c) 2018 Yellow Pages Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Mock server module
+
+Digest protected HTTP mock of a few Atlas endpoints, used by the stress and
+benchmark scripts (unlike atlasapi.testing.FakeAtlas, requests go through
+sockets, connection pools and the digest handshake)
+"""
+
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+CLUSTER = re.compile(r"^/api/atlas/v1\.0/groups/([^/]+)/clusters/([^/?]+)$")
+CLUSTERS = re.compile(r"^/api/atlas/v1\.0/groups/([^/]+)/clusters\?pageNum=(\d+)&itemsPerPage=(\d+)$")
+ROOT = "/api/atlas/v1.0"
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    # 64 workers connect at once
+    request_queue_size = 256
+
+
+class MockAtlas:
+    """Digest protected mock of the Atlas API
+
+    Every group has `clusters` clusters named c0, c1, ... Requests without a valid
+    digest answer (wrong nonce) are challenged with 401.
+
+    Constructor
+
+    Keyword Args:
+        clusters (int): Number of clusters per group
+        latency (float): Seconds spent by the server on each authenticated request
+        rtt (float): Seconds added to every response (challenges included)
+    """
+
+    NONCE = "2f1c6a9d"
+
+    def __init__(self, clusters=100, latency=0.0, rtt=0.0):
+        self.clusters = clusters
+        self.latency = latency
+        self.rtt = rtt
+
+        self.lock = threading.Lock()
+        self.challenges = 0
+        self.requests = 0
+        self.connections = set()
+
+        self.server = _Server(("127.0.0.1", 0), self._handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, name="mock-atlas", daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        """str: Base URL (to set as Settings.BASE_URL)"""
+        return "http://localhost:%d" % self.server.server_port
+
+    def reset(self):
+        """Reset the counters"""
+        with self.lock:
+            self.challenges = 0
+            self.requests = 0
+            self.connections = set()
+
+    def close(self):
+        """Stop the server"""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def answer(self, path):
+        """Build the answer of an authenticated GET
+
+        Args:
+            path (str): Path and query
+
+        Returns:
+            tuple: (status, payload)
+        """
+        if path == ROOT:
+            return 200, {"appName": "MongoDB Atlas"}
+
+        m = CLUSTER.match(path)
+        if m:
+            group, name = m.groups()
+            if int(name[1:]) >= self.clusters:
+                return 404, {"errorCode": "CLUSTER_NOT_FOUND"}
+            return 200, {"groupId": group, "name": name, "stateName": "IDLE"}
+
+        m = CLUSTERS.match(path)
+        if m:
+            group, pageNum, itemsPerPage = m.group(1), int(m.group(2)), int(m.group(3))
+            first = (pageNum - 1) * itemsPerPage
+            results = [{"groupId": group, "name": "c%d" % i, "stateName": "IDLE"}
+                       for i in range(first, min(first + itemsPerPage, self.clusters))]
+            return 200, {"totalCount": self.clusters, "results": results}
+
+        return 404, {"errorCode": "RESOURCE_NOT_FOUND"}
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body are written separately, avoid the delayed ACK stall
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status, payload, headers=()):
+                body = json.dumps(payload).encode()
+                if mock.rtt:
+                    time.sleep(mock.rtt)
+                self.send_response(status)
+                for header in headers:
+                    self.send_header(*header)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                with mock.lock:
+                    mock.connections.add(self.client_address)
+
+                if 'nonce="%s"' % MockAtlas.NONCE not in (self.headers.get("Authorization") or ""):
+                    with mock.lock:
+                        mock.challenges += 1
+                    challenge = 'Digest realm="MMS Public API", qop="auth", nonce="%s"' % MockAtlas.NONCE
+                    self.reply(401, {"errorCode": "UNAUTHORIZED"}, [("WWW-Authenticate", challenge)])
+                    return
+
+                with mock.lock:
+                    mock.requests += 1
+                if mock.latency:
+                    time.sleep(mock.latency)
+                self.reply(*mock.answer(self.path))
+
+        return Handler
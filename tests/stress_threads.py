@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# Copyright (c) 2018 Yellow Pages Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Thread-safety stress harness
+
+One Atlas instance is shared by 1, 8 and 64 threads hammering the same resource
+groups:
+
+- over HTTP against a digest protected mock server (tests/mockserver.py): every
+  response must match its request, the digest challenge must happen once for the
+  whole run and the throughput must scale with the number of threads
+- in process against atlasapi.testing.FakeAtlas: concurrent creations, reads,
+  existence checks, journaled updates and cluster waiters must leave the expected state
+
+usage: python tests/stress_threads.py [--operations 640] [--latency 0.02]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mockserver import MockAtlas
+
+from atlasapi.atlas import Atlas
+from atlasapi.journal import Journal
+from atlasapi.settings import Settings
+from atlasapi.specs import ClusterStatesSpec, DatabaseUsersPermissionsSpecs, DatabaseUsersUpdatePermissionsSpecs, RoleSpecs
+from atlasapi.testing import FakeAtlas
+
+THREADS = (1, 8, 64)
+GROUPS = 4
+
+
+def check(condition, message, *args):
+    """Fail the harness
+
+    Args:
+        condition (bool): Expected condition
+        message (str): Message format
+        *args: Message arguments
+
+    Raises:
+        AssertionError: The condition is false
+    """
+    if not condition:
+        raise AssertionError(message % args)
+
+
+def stress_http(args):
+    """Hammer a shared Atlas over HTTP
+
+    Args:
+        args (Namespace): Command line arguments
+
+    Returns:
+        dict: threads -> operations per second
+    """
+    mock = MockAtlas(clusters=args.clusters, latency=args.latency)
+    base_url = Settings.BASE_URL
+    Settings.BASE_URL = mock.url
+
+    try:
+        atlas = Atlas("user", "password", "group0", pool_maxsize=max(THREADS))
+        groups = [atlas.with_group("group%d" % i) for i in range(GROUPS)]
+
+        def operation(i):
+            group = groups[i % GROUPS]
+
+            if i % 32 == 0:
+                clusters = list(group.Clusters.get_all_clusters(itemsPerPage=args.clusters // 4, iterable=True))
+                check(len(clusters) == args.clusters, "listing of %s: %d clusters", group.group, len(clusters))
+                check(all(c["groupId"] == group.group for c in clusters), "listing of %s: foreign cluster", group.group)
+                return
+
+            name = "c%d" % (i % args.clusters)
+            cluster = group.Clusters.get_a_single_cluster(name)
+            check((cluster["groupId"], cluster["name"]) == (group.group, name),
+                  "asked %s/%s, got %s/%s", group.group, name, cluster["groupId"], cluster["name"])
+
+        throughput = {}
+        for threads in THREADS:
+            start = time.monotonic()
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                # result() re-raises the failures
+                for future in [executor.submit(operation, i) for i in range(args.operations)]:
+                    future.result()
+            throughput[threads] = args.operations / (time.monotonic() - start)
+            print("http    %2d threads: %7.1f ops/s, %d connections, %d challenge(s)" % (
+                threads, throughput[threads], len(mock.connections), mock.challenges))
+
+        check(mock.challenges == 1, "%d digest challenges instead of 1", mock.challenges)
+        check(len(mock.connections) <= max(THREADS), "%d connections for a pool of %d",
+              len(mock.connections), max(THREADS))
+        check(throughput[8] >= args.min_speedup * throughput[1], "8 threads: %.1fx the throughput of 1 thread",
+              throughput[8] / throughput[1])
+        check(throughput[64] >= throughput[8], "64 threads slower than 8 threads (%.1f < %.1f ops/s)",
+              throughput[64], throughput[8])
+
+        return throughput
+    finally:
+        Settings.BASE_URL = base_url
+        mock.close()
+
+
+def stress_fake(args):
+    """Hammer a shared Atlas in process
+
+    Args:
+        args (Namespace): Command line arguments
+    """
+    fake = FakeAtlas(latency=args.latency / 4)
+    groups = [fake.add_project("project%d" % i) for i in range(GROUPS)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with Journal(os.path.join(tmp, "stress.journal")) as journal:
+            atlas = Atlas("user", "password", groups[0], transport=fake, journal=journal)
+            shared = [atlas.with_group(group) for group in groups]
+
+            for threads in THREADS:
+                prefix = "u%d-" % threads
+
+                def create(i):
+                    group = shared[i % GROUPS]
+                    p = DatabaseUsersPermissionsSpecs(prefix + str(i), "password")
+                    p.add_roles("db%d" % i, [RoleSpecs.read])
+                    group.DatabaseUsers.create_a_database_user(p)
+
+                    update = DatabaseUsersUpdatePermissionsSpecs()
+                    update.add_roles("db%d" % i, [RoleSpecs.readWrite])
+                    group.DatabaseUsers.update_a_database_user(prefix + str(i), update)
+
+                    user = group.DatabaseUsers.get_a_single_database_user(prefix + str(i))
+                    check(user["roles"] == update.roles, "%s: roles %s", user["username"], user["roles"])
+
+                with ThreadPoolExecutor(max_workers=threads) as executor:
+                    for future in [executor.submit(create, i) for i in range(args.operations // 4)]:
+                        future.result()
+
+                for number, group in enumerate(shared):
+                    expected = set(prefix + str(i) for i in range(number, args.operations // 4, GROUPS))
+                    users = set(u["username"] for u in group.DatabaseUsers.get_all_database_users(iterable=True)
+                                if u["username"].startswith(prefix))
+                    check(users == expected, "%s: %d users instead of %d", group.group, len(users), len(expected))
+
+                    names = sorted(expected) + [prefix + "missing"]
+                    exist = group.DatabaseUsers.exist_many(names, concurrency=threads)
+                    check(exist == dict((name, name in expected) for name in names), "%s: exist_many", group.group)
+
+                print("fake    %2d threads: %d users checked" % (threads, args.operations // 4))
+
+            # Many threads waiting on the same clusters share one polling loop
+            clusters = [fake.add_cluster(groups[0], "w%d" % i, stateName=ClusterStatesSpec.CREATING) for i in range(4)]
+            with ThreadPoolExecutor(max_workers=max(THREADS)) as executor:
+                futures = [executor.submit(atlas.Clusters.wait_for_state, "w%d" % (i % 4), ClusterStatesSpec.IDLE, 30)
+                           for i in range(max(THREADS))]
+                time.sleep(0.5)
+                for cluster in clusters:
+                    cluster["stateName"] = ClusterStatesSpec.IDLE
+                for i, future in enumerate(futures):
+                    check(future.result() == {"w%d" % (i % 4): ClusterStatesSpec.IDLE}, "waiter %d: %s", i,
+                          future.result())
+            print("fake    %2d waiters resolved" % max(THREADS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress a shared Atlas instance from 1, 8 and 64 threads")
+    parser.add_argument("--operations", type=int, default=640, help="Operations per thread count")
+    parser.add_argument("--clusters", type=int, default=100, help="Clusters per group on the mock server")
+    parser.add_argument("--latency", type=float, default=0.02, help="Server latency per request (seconds)")
+    parser.add_argument("--min-speedup", type=float, default=4.0,
+                        help="Minimum throughput ratio between 8 threads and 1 thread")
+    args = parser.parse_args()
+
+    stress_http(args)
+    stress_fake(args)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()